@@ -0,0 +1,225 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+OpenAI compatible stub of the LLM judge, to test the judge client end to end over HTTP.
+
+It serves the chat completions and completions endpoints with the deterministic verdicts of the throughput
+benchmark mock, adds a latency to every request and answers a fraction of them with 429 and a Retry-After
+header. The choices of a completions request are returned shuffled, each with the index of its prompt.
+
+With --check it evaluates synthetic rows through the real OpenAI client against a stub started in the same
+process, and fails unless every row comes back evaluated, in the order of the input and with the verdict of
+its own prompt.
+
+Usage (from the repository root):
+    python benchmarks/judge_stub.py [--port 8000] [--latency 0.2] [--rate-limit 0.1]
+    python benchmarks/judge_stub.py --check 200 [--backend completions] [--latency 0.05] [--rate-limit 0.2]
+"""
+
+import argparse, json, os, random, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from throughput import WORDS, _mock_verdict, _sentence, mock_openai_response
+
+STUB_MODEL = "judge-stub"
+
+class JudgeStub:
+    """
+    The stub server, serving in a background thread between start() and stop().
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, rate_limit=0.0, retry_after=1, seed=0):
+        """
+        Args:
+            host: address the server listens on.
+            port: port the server listens on, 0 for any free port.
+            latency: seconds every request takes, a batch of prompts takes as long as a single one.
+            rate_limit: fraction of the requests answered with 429.
+            retry_after: seconds sent in the Retry-After header of the 429 answers.
+            seed: seed of the choice of the rate limited requests.
+        """
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.server = ThreadingHTTPServer((host, port), self.__handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def answer(self, path, body):
+        """
+        Returns the HTTP status, the extra headers and the JSON body of the answer to a request.
+        """
+        with self.lock:
+            self.requests += 1
+            limited = self.rng.random() < self.rate_limit
+            self.rate_limited += limited
+        if limited:
+            return 429, {"Retry-After": str(self.retry_after)}, {"error": {"message": "Rate limit reached.", "type": "rate_limit_error"}}
+        time.sleep(self.latency)
+        if path.endswith("/chat/completions"):
+            prompts = [body["messages"][-1]["content"]]
+        elif path.endswith("/completions"):
+            prompts = body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]]
+        else:
+            return 404, {}, {"error": {"message": f"Unknown path {path}.", "type": "invalid_request_error"}}
+        contents = [mock_openai_response(prompt) for prompt in prompts]
+        usage = {"prompt_tokens": sum(len(prompt) // 4 for prompt in prompts),
+                 "completion_tokens": sum(len(content) // 4 for content in contents)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if path.endswith("/chat/completions"):
+            choices = [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": contents[0]}}]
+            kind = "chat.completion"
+        else:
+            # clients must put the answers back in the order of the prompts by their index
+            choices = [{"index": i, "finish_reason": "stop", "text": content, "logprobs": None} for i, content in enumerate(contents)]
+            with self.lock:
+                self.rng.shuffle(choices)
+            kind = "text_completion"
+        return 200, {}, {"id": f"stub-{self.requests}", "object": kind, "created": int(time.time()),
+                         "model": body.get("model", STUB_MODEL), "choices": choices, "usage": usage}
+
+    def __handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, headers, answer = stub.answer(self.path, body)
+                payload = json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def _records(rows, seed=0):
+    rng = random.Random(seed)
+    records = []
+    for i in range(rows):
+        golden = _sentence(rng, rng.randint(5, 20))
+        records.append({"SNo.": i + 1, "Question": f"What was the {rng.choice(WORDS)} of the company in fiscal {2018 + i % 5}?",
+                        "Golden Context": "", "Golden Response": golden,
+                        "Candidate Response": " ".join(golden.split()[:rng.randint(1, 10)]) + " " + _sentence(rng, 10)})
+    return records
+
+def check(rows, backend, latency, rate_limit, concurrency, batch_size):
+    """
+    Evaluate `rows` synthetic rows against a stub and check the results.
+
+    Returns:
+        dict with the numbers of rows, requests and rate limited requests, and the list of the problems found.
+    """
+    from evaluate import Evaluate, prompt_template5
+    from judge_backend import make_backend
+
+    stub = JudgeStub(latency=latency, rate_limit=rate_limit).start()
+    try:
+        evaluator = Evaluate(metrics=["llm"], concurrency=concurrency, judge_retries=20,
+                             judge_backend=make_backend(backend, STUB_MODEL, stub.url, "stub", max_connections=concurrency,
+                                                        max_batch=batch_size))
+        records = _records(rows)
+        start = time.perf_counter()
+        results = evaluator.evaluate_records(records).to_dict('records')
+        seconds = time.perf_counter() - start
+        evaluator.close()
+    finally:
+        stub.stop()
+
+    problems = []
+    if [row["SNo."] for row in results] != [record["SNo."] for record in records]:
+        problems.append("the rows did not come back in the order of the input")
+    for record, row in zip(records, results):
+        if row["LLM Status"] != "ok":
+            problems.append(f"row {record['SNo.']} was not evaluated")
+            continue
+        # the stub seeds the verdict with the prompt, so every row must have the verdict of its own prompt
+        verdict = _mock_verdict(prompt_template5.format(record["Question"], record["Golden Response"], record["Candidate Response"]))
+        counts = [row["Golden Response Claim Count"], row["Candidate Response Claim Count"], row["Common Claim Count"]]
+        golden, candidate, common = (verdict[key] for key in ["No of Golden Response Claims", "No of Candidate Response Claims",
+                                                              "No of Common Claims"])
+        # the candidate count is raised to the common count, as in the evaluator
+        if counts != [golden, max(candidate, common), common]:
+            problems.append(f"row {record['SNo.']} has the verdict of another prompt")
+    return {"rows": len(results), "requests": stub.requests, "rate_limited": stub.rate_limited,
+            "seconds": seconds, "problems": problems}
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI compatible stub of the LLM judge.")
+    parser.add_argument('--host', type=str, default="127.0.0.1", help='Address to listen on. (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on. (default: 8000)')
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds every request takes. (default: 0.2)')
+    parser.add_argument('--rate-limit', dest='rate_limit', type=float, default=0.1, help='Fraction of the requests answered with 429. (default: 0.1)')
+    parser.add_argument('--retry-after', dest='retry_after', type=int, default=1, help='Seconds of the Retry-After header of the 429 answers. (default: 1)')
+    parser.add_argument('--check', type=int, default=None, help='Evaluate this many synthetic rows against the stub and check the results instead of serving.')
+    parser.add_argument('--backend', type=str, default="chat", help='Judge backend of the check, chat or completions. (default: chat)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Judge calls in flight at the same time during the check. (default: 16)')
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=8, help='Prompts per request of the completions backend during the check. (default: 8)')
+    args = parser.parse_args()
+
+    if args.check is not None:
+        result = check(args.check, args.backend, args.latency, args.rate_limit, args.concurrency, args.batch_size)
+        print(json.dumps(result, indent=2))
+        sys.exit(1 if result["problems"] else 0)
+
+    stub = JudgeStub(args.host, args.port, args.latency, args.rate_limit, args.retry_after)
+    print(f"Judge stub listening on {stub.url}, use --judge-base-url {stub.url} --judge-model {STUB_MODEL}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Startup time benchmark of the judge only code path used by `main.py evaluate_question`.
+
+It measures, in fresh interpreters, the time to import the CLI and construct an LLM only evaluator, and
+checks that none of the heavy metric dependencies get imported on that path.
+
+Usage (from the repository root):
+    python benchmarks/startup_time.py [--repeat 5] [--max-seconds 1.0]
+"""
+
+import argparse, json, os, statistics, subprocess, sys
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source")
+HEAVY_MODULES = ["torch", "sentence_transformers", "bert_score", "transformers", "nltk", "rouge_score", "pandas"]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {source_dir!r})
+import main
+from evaluate import Evaluate
+Evaluate(metrics=["llm"])
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+def measure(repeat):
+    probe = PROBE.format(source_dir=os.path.abspath(SOURCE_DIR), heavy=HEAVY_MODULES)
+    timings = []
+    loaded = set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True).stdout.splitlines()
+        timings.append(float(output[0]))
+        loaded.update(m for m in output[1].split(",") if m)
+    return {
+        "repeat": repeat,
+        "median_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "max_seconds": max(timings),
+        "heavy_modules_loaded": sorted(loaded)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time benchmark of the judge only code path.")
+    parser.add_argument('--repeat', type=int, default=5, help='Number of fresh interpreters to measure. (default: 5)')
+    parser.add_argument('--max-seconds', dest='max_seconds', type=float, default=None, help='Fail if the median startup time exceeds this budget.')
+    args = parser.parse_args()
+
+    result = measure(args.repeat)
+    print(json.dumps(result, indent=2))
+
+    if result["heavy_modules_loaded"]:
+        print(f"Heavy modules imported on the judge only path: {result['heavy_modules_loaded']}", file=sys.stderr)
+        sys.exit(1)
+    if args.max_seconds is not None and result["median_seconds"] > args.max_seconds:
+        print(f"Median startup time {result['median_seconds']:.3f}s exceeds the budget of {args.max_seconds}s", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
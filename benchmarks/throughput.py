@@ -0,0 +1,220 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Throughput benchmark of the evaluation pipeline.
+
+It generates synthetic benchmark workbooks and Dataworkz QnA response dumps shaped like the Apple 10-K data,
+runs the full pipeline (parsing, collation and Evaluate.evaluate_records) against a deterministic mock of the
+LLM judge with a configurable latency, and reports rows per second, peak RSS and the time of each metric as JSON.
+
+Usage (from the repository root):
+    python benchmarks/throughput.py [--sizes 100,10000,100000] [--metrics llm,bleu,rouge] [--latency 0.5] [--output result.json]
+"""
+
+import argparse, json, os, random, re, resource, sys, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source"))
+
+from evaluate import DEFAULT_METRICS
+
+WORDS = ["revenue", "net", "sales", "iPhone", "Mac", "services", "fiscal", "year", "company", "operating", "income",
+         "increased", "decreased", "compared", "segment", "Americas", "Europe", "Greater", "China", "gross", "margin",
+         "dividends", "shares", "repurchased", "billion", "million", "percent", "research", "development", "expenses"]
+
+def _sentence(rng, length):
+    words = [rng.choice(WORDS) for _ in range(length)]
+    words.insert(rng.randrange(len(words)), f"${rng.randint(1, 999)}.{rng.randint(0, 9)} billion")
+    return " ".join(words).capitalize() + "."
+
+def generate_dataset(rows, directory, seed=0):
+    """
+    Write a synthetic benchmark workbook and QnA response dump with `rows` rows.
+
+    Returns:
+        (benchmark_file, response_file)
+    """
+    import pandas as pd
+    rng = random.Random(seed)
+    benchmark = []
+    with open(os.path.join(directory, "responses.txt"), "w") as dump:
+        for i in range(rows):
+            question = f"What was the {rng.choice(WORDS)} {rng.choice(WORDS)} of the company in fiscal {2018 + i % 5}?"
+            golden = " ".join(_sentence(rng, rng.randint(5, 20)) for _ in range(rng.randint(1, 3)))
+            # candidates reuse part of the golden response and add some text of their own
+            golden_words = golden.split()
+            candidate = " ".join(golden_words[:rng.randint(1, len(golden_words))]) + " " + _sentence(rng, rng.randint(5, 30))
+            context = " ".join(_sentence(rng, 25) for _ in range(4))
+            benchmark.append({"Query": question, "Golden Response": golden, "Golden Context": context,
+                              "Category": "synthetic", "Filename": "synthetic.pdf", "Source": "synthetic"})
+            dump.write(f"question : {question}\n")
+            dump.write(f"answer : \n\n{candidate}\n\n")
+            dump.write("links : [s3a://synthetic/synthetic.pdf]\n")
+            dump.write(f"systemId : synthetic-{seed}\n")
+            dump.write(f"systemName : synthetic_system_{seed}\n")
+            dump.write(f"queryPlan : {{steps=[{{id=0, type=qna, config={{}}, query={question}, context=[]}}], messages=[]}}\n")
+            dump.write("type : qna\n")
+            dump.write(f"questionUuid : {i:08d}\n")
+            dump.write("status : COMPLETED\n")
+            dump.write("probe : Use -p to show probe data\n")
+    benchmark_file = os.path.join(directory, "benchmark.xlsx")
+    pd.DataFrame(benchmark).to_excel(benchmark_file, index=False)
+    return benchmark_file, os.path.join(directory, "responses.txt")
+
+def mock_openai_response(prompt, latency=0.0):
+    """
+    Deterministic stand-in for the judge backend returning a well formed judge verdict, or one
+    verdict per item for packed prompts.
+    """
+    time.sleep(latency)
+    item_ids = re.findall(r"### Start Item ID: (\S+)", prompt)
+    if item_ids:
+        response = {item_id: _mock_verdict(prompt + item_id) for item_id in item_ids}
+    else:
+        response = _mock_verdict(prompt)
+    return "```json\n" + json.dumps(response, indent=4) + "\n```"
+
+def _mock_verdict(seed):
+    rng = random.Random(seed)
+    golden_cnt = rng.randint(1, 6)
+    candidate_cnt = rng.randint(1, 8)
+    common_cnt = rng.randint(0, golden_cnt)
+    claims = lambda n, prefix: {str(i + 1): f"{prefix} claim {i + 1}." for i in range(n)}
+    response = {
+        "Golden Response Claims": claims(golden_cnt, "Golden"),
+        "Candidate Response Claims": claims(candidate_cnt, "Candidate"),
+        "Common Claims": claims(common_cnt, "Golden"),
+        "No of Golden Response Claims": golden_cnt,
+        "No of Candidate Response Claims": candidate_cnt,
+        "No of Common Claims": common_cnt
+    }
+    return response
+
+def _mock_completion(prompt, latency):
+    response = mock_openai_response(prompt, latency)
+    # roughly 4 characters per token
+    return response, {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(response) // 4}
+
+def _mock_backend(latency, judge_batch_size):
+    from judge_backend import JudgeBackend
+
+    class MockBackend(JudgeBackend):
+        # a batch takes as long as a single prompt, like the batched generation of a local model server
+        max_batch = judge_batch_size
+
+        def complete(self, prompt, timeout=None):
+            return _mock_completion(prompt, latency)
+
+        def complete_batch(self, prompts, timeout=None):
+            time.sleep(latency)
+            answers = [_mock_completion(prompt, 0.0) for prompt in prompts]
+            usage = {key: sum(answer[1][key] for answer in answers) for key in ["prompt_tokens", "completion_tokens"]}
+            return [answer[0] for answer in answers], usage
+
+    return MockBackend("mock")
+
+def _run(benchmark_file, response_file, metrics, latency, concurrency, judge_pack_size=1, judge_batch_size=1):
+    # runs in its own process so that the peak RSS belongs to this pipeline only
+    from evaluate import Evaluate
+    from utils import extract_response, get_golden_response, collate_responses
+
+    start = time.perf_counter()
+    question, cand_resp = extract_response(response_file, "question :", "answer :", "links :")
+    golden_resp, golden_ctxt = get_golden_response(benchmark_file)
+    records = collate_responses(question, golden_ctxt, golden_resp, cand_resp)
+    load_seconds = time.perf_counter() - start
+
+    evaluator = Evaluate(metrics=metrics, concurrency=concurrency, judge_pack_size=judge_pack_size,
+                         judge_backend=_mock_backend(latency, judge_batch_size))
+    start = time.perf_counter()
+    with tempfile.NamedTemporaryFile(suffix=".csv") as eval_file:
+        evaluator.evaluate_records(records, eval_file.name)
+    evaluate_seconds = time.perf_counter() - start
+    judge_stats = evaluator.tracer.summary().get("judge", {})
+
+    return {
+        "rows": len(records),
+        "judge_pack_size": judge_pack_size,
+        "judge_batch_size": judge_batch_size,
+        "judge_requests": judge_stats.get("count", 0),
+        "judge_prompt_tokens": judge_stats.get("prompt_tokens", 0),
+        "judge_completion_tokens": judge_stats.get("completion_tokens", 0),
+        "load_seconds": load_seconds,
+        "evaluate_seconds": evaluate_seconds,
+        "rows_per_second": len(records) / (load_seconds + evaluate_seconds),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def run_in_process(*args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_run, *args).result()
+
+def benchmark(size, metrics, latency, concurrency, per_metric=True, judge_pack_sizes=(1,), judge_batch_size=1):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        benchmark_file, response_file = generate_dataset(size, directory)
+        for judge_pack_size in judge_pack_sizes:
+            result = {"size": size, "metrics": metrics}
+            result.update(run_in_process(benchmark_file, response_file, metrics, latency, concurrency, judge_pack_size, judge_batch_size))
+            if per_metric:
+                result["metric_seconds"] = {metric: run_in_process(benchmark_file, response_file, [metric], latency, concurrency, judge_pack_size, judge_batch_size)["evaluate_seconds"]
+                                            for metric in metrics}
+            results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the evaluation pipeline.")
+    parser.add_argument('--sizes', type=str, default="100,10000,100000", help='Comma separated numbers of rows. (default: 100,10000,100000)')
+    parser.add_argument('--metrics', type=str, default=",".join(DEFAULT_METRICS), help=f'Comma separated metrics to run. (default: {",".join(DEFAULT_METRICS)})')
+    parser.add_argument('--latency', type=float, default=0.5, help='Latency in seconds of every mock judge call. (default: 0.5)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of judge calls in flight at the same time. (default: 8)')
+    parser.add_argument('--judge-pack-sizes', dest='judge_pack_sizes', type=str, default="1", help='Comma separated judge pack sizes to compare, e.g. 1,8. (default: 1)')
+    parser.add_argument('--judge-batch-size', dest='judge_batch_size', type=int, default=1, help='Number of prompts the mock judge answers in one request taking --latency seconds, like a batched local model server. (default: 1)')
+    parser.add_argument('--no-per-metric', dest='per_metric', action='store_false', help='Skip the runs timing every metric on its own.')
+    parser.add_argument('--output', type=str, default=None, help='File to write the JSON result to. (default: stdout)')
+    args = parser.parse_args()
+
+    metrics = [metric for metric in args.metrics.split(",") if metric]
+    results = {
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "latency": args.latency,
+        "concurrency": args.concurrency,
+        "runs": [run for size in args.sizes.split(",")
+                 for run in benchmark(int(size), metrics, args.latency, args.concurrency, args.per_metric,
+                                      [int(pack_size) for pack_size in args.judge_pack_sizes.split(",")], args.judge_batch_size)]
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
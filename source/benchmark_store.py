@@ -0,0 +1,161 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib, json, logging, os, time
+
+# Benchmarks come as Excel workbooks, which take long to parse. A workbook is converted once to a Parquet sidecar
+# in the cache directory, named after the sha256 of its content, and later runs read only the columns they need
+# from the sidecar. The size and modification time of every converted workbook are kept in an index so that an
+# unchanged workbook is not hashed again. csv, JSON lines and Parquet benchmarks are read directly.
+
+# bumped when the conversion changes, so that the sidecars of the previous conversion are not used
+SIDECAR_VERSION = 1
+WORKBOOK_EXTENSIONS = [".xlsx", ".xlsm", ".xls"]
+
+def file_digest(path):
+    """
+    sha256 hex digest of the content of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024**2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _select(df, columns, benchmark_file):
+    if columns is None:
+        return df
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"The benchmark {benchmark_file} has no {missing} column(s).")
+    return df[list(columns)]
+
+def _read_parquet(path, columns):
+    import pyarrow.parquet as pq
+    if columns is not None:
+        names = pq.read_schema(path).names
+        columns = [column for column in columns if column in names]
+    return pq.read_table(path, columns=columns).to_pandas()
+
+def _to_columnar(df):
+    import pandas as pd
+    df.columns = [str(column) for column in df.columns]
+    for column in df.columns:
+        # cells of different types, e.g. numbers and text in the same column, are stored as text, which is how
+        # the benchmark values are evaluated anyway
+        if df[column].dtype == object and not all(isinstance(value, str) for value in df[column].dropna()):
+            df[column] = df[column].map(lambda value: value if pd.isna(value) else str(value))
+    return df
+
+class BenchmarkStore:
+    """
+    Parquet sidecars of benchmark workbooks, keyed by the sha256 of the workbooks.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        self.index_path = os.path.join(store_dir, "index.json")
+
+    def __load_index(self):
+        try:
+            with open(self.index_path, 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def __save_index(self, index):
+        # several shards may convert workbooks at the same time, every writer replaces the index atomically
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(index, file, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def __digest(self, workbook):
+        stat = os.stat(workbook)
+        path = os.path.abspath(workbook)
+        index = self.__load_index()
+        entry = index.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+        digest = file_digest(workbook)
+        index[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        self.__save_index(index)
+        return digest
+
+    def sidecar(self, workbook):
+        """
+        Path of the Parquet sidecar of a workbook, converting the workbook when it has no sidecar yet.
+        """
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        path = os.path.join(self.store_dir, f"{self.__digest(workbook)}.v{SIDECAR_VERSION}.parquet")
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            df = _to_columnar(pd.read_excel(workbook))
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+            logging.info(f"Converted the benchmark {workbook} to {path} in {time.perf_counter() - start:.2f}s.")
+        return path
+
+def load_benchmark(benchmark_file, columns=None, cache_dir=None):
+    """
+    Read a benchmark from an Excel workbook, a csv, JSON lines (.jsonl) or Parquet file.
+
+    Args:
+        benchmark_file: the benchmark file, its format is given by its extension.
+        columns: columns to read, None for all of them.
+        cache_dir: directory of the Parquet sidecars of the workbooks, None to parse the workbook on every call.
+            Needs pyarrow, workbooks are parsed on every call without it.
+
+    Returns:
+        DataFrame with the requested columns.
+
+    Raises:
+        ValueError: the format is not supported or a requested column is missing.
+    """
+    import pandas as pd
+    extension = os.path.splitext(benchmark_file)[1].lower()
+    if extension in WORKBOOK_EXTENSIONS:
+        if cache_dir is not None:
+            try:
+                import pyarrow
+            except ImportError:
+                logging.warning("Benchmark workbooks are only cached with pyarrow installed: pip install pyarrow")
+                cache_dir = None
+        if cache_dir is None:
+            df = pd.read_excel(benchmark_file, usecols=lambda column: columns is None or column in columns)
+        else:
+            df = _read_parquet(BenchmarkStore(os.path.join(cache_dir, "benchmarks")).sidecar(benchmark_file), columns)
+    elif extension == ".csv":
+        df = pd.read_csv(benchmark_file, usecols=lambda column: columns is None or column in columns)
+    elif extension == ".jsonl":
+        df = pd.read_json(benchmark_file, lines=True, dtype=False)
+    elif extension == ".parquet":
+        df = _read_parquet(benchmark_file, columns)
+    else:
+        raise ValueError(f"Unsupported benchmark format '{extension}', use one of {WORKBOOK_EXTENSIONS + ['.csv', '.jsonl', '.parquet']}.")
+    return _select(df, columns, benchmark_file)
@@ -0,0 +1,93 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from collections import defaultdict
+import torch
+from torch.nn.utils.rnn import pad_sequence
+from bert_score.utils import get_bert_embedding, greedy_cos_idf
+from scoring_pool import length_batches, by_sentence, word_count
+
+# Helpers splitting BERTScore into an encoding step and a matching step, so that the features
+# of the reference side can be stored and reused across runs. They follow bert_score.utils.bert_cos_score_idf.
+
+def encode(scorer, sentences, batch_size=64):
+    """
+    Compute the BERTScore features of every sentence.
+
+    Args:
+        scorer: bert_score.BERTScorer providing the model and tokenizer.
+        sentences: list of sentences.
+        batch_size: number of sentences per forward pass.
+
+    Returns:
+        One float32 array of shape (tokens, dim + 1) per sentence, holding the token embeddings
+        with the idf weight of each token as the last column.
+    """
+    # sentences of similar length are batched together to minimize padding
+    batches = length_batches(sentences, batch_size, word_count)
+    return by_sentence(sentences, batches, (encode_batch(scorer, batch) for batch in batches))
+
+def encode_batch(scorer, batch):
+    """
+    Compute the BERTScore features of the sentences of a single forward pass.
+    """
+    idf_dict = defaultdict(lambda: 1.0)
+    idf_dict[scorer._tokenizer.sep_token_id] = 0
+    idf_dict[scorer._tokenizer.cls_token_id] = 0
+
+    embs, masks, padded_idf = get_bert_embedding(batch, scorer._model, scorer._tokenizer, idf_dict, device=scorer.device)
+    embs, masks, padded_idf = embs.cpu(), masks.cpu(), padded_idf.cpu().float()
+    features = []
+    for i in range(len(batch)):
+        sequence_len = masks[i].sum().item()
+        features.append(torch.cat([embs[i, :sequence_len], padded_idf[i, :sequence_len].unsqueeze(1)], dim=1).numpy())
+    return features
+
+def _pad(features):
+    tensors = [torch.tensor(f) for f in features]
+    lens = torch.tensor([t.size(0) for t in tensors], dtype=torch.long)
+    emb_pad = pad_sequence([t[:, :-1] for t in tensors], batch_first=True, padding_value=2.0)
+    idf_pad = pad_sequence([t[:, -1] for t in tensors], batch_first=True)
+    pad_mask = torch.arange(lens.max(), dtype=torch.long).expand(len(lens), lens.max()) < lens.unsqueeze(1)
+    return emb_pad, pad_mask, idf_pad
+
+def score(scorer, ref_features, cand_features, batch_size=64):
+    """
+    Compute BERTScore precision, recall and F1 of every candidate against its reference from their features.
+    """
+    preds = [score_batch(scorer, ref_features[start:start + batch_size], cand_features[start:start + batch_size])
+             for start in range(0, len(ref_features), batch_size)]
+    preds = torch.cat(preds, dim=0)
+    return preds[:, 0].tolist(), preds[:, 1].tolist(), preds[:, 2].tolist()
+
+def score_batch(scorer, ref_features, cand_features):
+    """
+    Compute the BERTScore precision, recall and F1 of a batch of pairs, as a tensor of shape (pairs, 3).
+    """
+    with torch.no_grad():
+        P, R, F1 = greedy_cos_idf(*_pad(ref_features), *_pad(cand_features), scorer.all_layers)
+        preds = torch.stack((P, R, F1), dim=-1)
+    if scorer.rescale_with_baseline:
+        preds = (preds - scorer.baseline_vals) / (1 - scorer.baseline_vals)
+    return preds
@@ -0,0 +1,289 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import math, re
+
+# Tiered evaluation: a fast deterministic tier decides the rows whose verdict is obvious without the LLM judge,
+# e.g. a single number of the golden response missing from the candidate, and only the remaining rows are sent
+# to the judge. The verdicts of the fast tier have the same fields as the answers of the judge, with the whole
+# golden and candidate responses as their single claims, so the LLM columns are computed the same way.
+
+CASCADE_TIERS = ["numeric", "date", "entity", "lexical"]
+JUDGE_TIER = "judge"
+
+_MONTHS = {month: i + 1 for i, month in enumerate(["january", "february", "march", "april", "may", "june", "july",
+                                                   "august", "september", "october", "november", "december"])}
+_MONTHS.update({month[:3]: number for month, number in list(_MONTHS.items())})
+_MONTHS["sept"] = 9
+_MONTH = r"(?P<month>" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\.?"
+_DATE_PATTERNS = [
+    re.compile(_MONTH + r"\s+(?P<day>\d{1,2}),?\s+(?P<year>\d{4})\b", re.IGNORECASE),
+    re.compile(r"\b(?P<day>\d{1,2})\s+" + _MONTH + r",?\s+(?P<year>\d{4})\b", re.IGNORECASE),
+    re.compile(r"\b(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})\b"),
+    re.compile(r"\b(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<year>\d{4})\b")
+]
+_SCALES = {"thousand": 1e3, "k": 1e3, "million": 1e6, "mn": 1e6, "m": 1e6, "billion": 1e9, "bn": 1e9, "b": 1e9,
+           "trillion": 1e12, "tn": 1e12}
+_NUMBER = re.compile(r"(?P<open>\()?(?P<sign>-)?\$?(?P<value>\d[\d,]*(?:\.\d+)?|\.\d+)\)?"
+                     r"(?:\s*(?P<percent>%|percent\b)|\s*(?P<scale>" + "|".join(sorted(_SCALES, key=len, reverse=True)) + r")\b)?",
+                     re.IGNORECASE)
+_ENTITY_STOPWORDS = {"the", "a", "an", "of", "and", "inc", "corp", "corporation", "co", "company", "ltd", "llc", "plc"}
+
+def parse_dates(text):
+    """
+    Dates written like "March 25, 2022", "25 March 2022", "2022-03-25" or "3/25/2022", as (year, month, day)
+    tuples, and the text with the dates removed.
+    """
+    dates = []
+    def replace(match):
+        month = match.group("month").lower().rstrip(".")
+        month = _MONTHS[month] if month in _MONTHS else int(month)
+        dates.append((int(match.group("year")), month, int(match.group("day"))))
+        return " "
+    for pattern in _DATE_PATTERNS:
+        text = pattern.sub(replace, text)
+    return dates, text
+
+def parse_numbers(text):
+    """
+    Numbers of a text as (value, resolution, is_percent) tuples. Thousands separators, currency signs, negative
+    numbers in parentheses and scale words like "million" are normalized, the resolution is the unit of the
+    last digit written, e.g. 0.1e9 for "$2.8 billion".
+    """
+    numbers = []
+    for match in _NUMBER.finditer(text):
+        # digits inside words, e.g. "10-K", "Q3" or "Form S-8", are not amounts
+        start, end = match.start("value"), match.end()
+        if start > 0 and (text[start - 1].isalpha() or text[start - 1] == "-" and start > 1 and text[start - 2].isalnum()):
+            continue
+        if text[end:end + 1].isalpha() or text[end:end + 1] == "-" and text[end + 1:end + 2].isalnum():
+            continue
+        digits = match.group("value").replace(",", "")
+        decimals = len(digits.split(".")[1]) if "." in digits else 0
+        scale = _SCALES[match.group("scale").lower()] if match.group("scale") else 1
+        value = float(digits) * scale
+        if match.group("sign") or (match.group("open") and match.group(0).endswith(")")):
+            value = -value
+        numbers.append((value, 10 ** -decimals * scale, match.group("percent") is not None))
+    return numbers
+
+def _same_number(a, b):
+    # a percentage also matches the same ratio written as a fraction, e.g. "25%" and "0.25", or without the sign
+    if a[2] != b[2]:
+        percent, number = (a, b) if a[2] else (b, a)
+        return (_same_number((percent[0] / 100, percent[1] / 100, False), number)
+                or _same_number((percent[0], percent[1], False), number))
+    # equal at the precision of the less precise of the two, so that "$2.8 trillion" matches "$2,830,067 million"
+    return abs(a[0] - b[0]) <= max(a[1], b[1]) / 2 + 1e-9 * max(abs(a[0]), abs(b[0]))
+
+def normalize_entity(text):
+    """
+    Lower case words of a name without punctuation, articles and company suffixes.
+    """
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in _ENTITY_STOPWORDS]
+
+def _contains(words, phrase):
+    return any(words[i:i + len(phrase)] == phrase for i in range(len(words) - len(phrase) + 1))
+
+class Cascade:
+    """
+    Fast tier of the evaluation deciding the rows whose verdict is obvious from normalized values and the
+    lexical and similarity scores. Undecided rows are left to the LLM judge.
+    """
+
+    def __init__(self, max_golden_words=12, max_candidate_words=25, similarity_high=0.95, rouge_high=0.9,
+                 similarity_low=0.05, rouge_low=0.1):
+        """
+        Args:
+            max_golden_words: golden responses up to this length holding a single number, date or name are compared
+                by value.
+            max_candidate_words: candidates up to this length matching the golden value are decided as a match. Longer
+                candidates hold more claims, which lower the precision of the judge, so they go to the judge.
+            similarity_high: similarity score from which, together with rouge_high, the candidate is decided as a match.
+            rouge_high: Rouge-L score from which, together with similarity_high, the candidate is decided as a match.
+            similarity_low: similarity score up to which, together with rouge_low, the candidate is decided as a mismatch.
+            rouge_low: Rouge-1 score up to which, together with similarity_low, the candidate is decided as a mismatch.
+        """
+        self.max_golden_words = max_golden_words
+        self.max_candidate_words = max_candidate_words
+        self.similarity_high = similarity_high
+        self.rouge_high = rouge_high
+        self.similarity_low = similarity_low
+        self.rouge_low = rouge_low
+
+    @property
+    def settings(self):
+        return dict(vars(self))
+
+    def decide(self, golden_response, candidate_response, scores=None):
+        """
+        Decide a row without the judge when its verdict is obvious.
+
+        Args:
+            golden_response: the golden response of the benchmark.
+            candidate_response: the response of the RAG system.
+            scores: dict of the "Similarity Score", "Rouge-1" and "Rouge-L" columns of the row, when computed.
+
+        Returns:
+            the tier deciding the row out of CASCADE_TIERS and a verdict with the fields of a judge answer,
+            None if the row is left to the judge.
+        """
+        golden = "" if _missing(golden_response) else str(golden_response).strip()
+        candidate = "" if _missing(candidate_response) else str(candidate_response).strip()
+        if not golden:
+            return None
+        short_candidate = len(candidate.split()) <= self.max_candidate_words
+        if len(golden.split()) <= self.max_golden_words:
+            golden_dates, golden_rest = parse_dates(golden)
+            candidate_dates, candidate_rest = parse_dates(candidate)
+            golden_numbers = parse_numbers(golden_rest)
+            if len(golden_numbers) == 1 and not golden_dates:
+                # a missing amount is a mismatch however long the candidate is, the recall is 0 either way
+                if any(_same_number(golden_numbers[0], number) for number in parse_numbers(candidate_rest)):
+                    return ("numeric", verdict(golden, candidate, True)) if short_candidate else None
+                return "numeric", verdict(golden, candidate, False)
+            if len(golden_dates) == 1 and not golden_numbers:
+                if golden_dates[0] in candidate_dates:
+                    return ("date", verdict(golden, candidate, True)) if short_candidate else None
+                # a date written in another form than the parsed ones is left to the judge
+                return ("date", verdict(golden, candidate, False)) if candidate_dates else None
+            if not golden_numbers and not golden_dates:
+                name = normalize_entity(golden)
+                if name and len(name) <= 6 and short_candidate and _contains(normalize_entity(candidate), name):
+                    return "entity", verdict(golden, candidate, True)
+        scores = scores or {}
+        similarity, rouge_1, rouge_l = (scores.get(column) for column in ["Similarity Score", "Rouge-1", "Rouge-L"])
+        if _known(similarity) and _known(rouge_l) and similarity >= self.similarity_high and rouge_l >= self.rouge_high:
+            return "lexical", verdict(golden, candidate, True)
+        if _known(similarity) and _known(rouge_1) and similarity <= self.similarity_low and rouge_1 <= self.rouge_low:
+            return "lexical", verdict(golden, candidate, False)
+        return None
+
+def _missing(value):
+    return value is None or isinstance(value, float) and math.isnan(value)
+
+def _known(value):
+    return isinstance(value, (int, float)) and not math.isnan(value)
+
+def verdict(golden_response, candidate_response, match):
+    """
+    Judge answer of a row decided by the fast tier, with the whole responses as their single claims.
+    """
+    return {
+        "Golden Response Claims": {"1": golden_response},
+        "Candidate Response Claims": {"1": candidate_response} if candidate_response else {},
+        "Common Claims": {"1": golden_response} if match else {},
+        "No of Golden Response Claims": 1,
+        "No of Candidate Response Claims": 1 if candidate_response else 0,
+        "No of Common Claims": 1 if match else 0
+    }
+
+CALIBRATION_COLUMNS = ["LLM F1", "LLM Tier", "Golden Response", "Candidate Response", "Similarity Score", "Rouge-1", "Rouge-L"]
+
+def _join_runs(judge_df, cascade_df):
+    # the runs are matched by system and serial number, by serial number only for runs of a single system
+    # named after their files
+    judge_systems, cascade_systems = set(judge_df["System"]), set(cascade_df["System"])
+    keys = ["System", "SNo."]
+    if judge_systems != cascade_systems:
+        if len(judge_systems) > 1 or len(cascade_systems) > 1:
+            raise ValueError(f"The systems of the runs differ: {sorted(judge_systems)} and {sorted(cascade_systems)}.")
+        keys = ["SNo."]
+    cascade_df = cascade_df[keys + [column for column in ["LLM F1", "LLM Tier"] if column in cascade_df.columns]]
+    return judge_df.merge(cascade_df.rename(columns={"LLM F1": "LLM F1 Cascade", "LLM Tier": "LLM Tier Cascade"}), on=keys)
+
+def calibration_report(judge_df, cascade_df=None, cascade=None, threshold=0.5):
+    """
+    Agreement of the fast tier with the judge, per tier.
+
+    Args:
+        judge_df: results of a run with the judge on every row, as returned by report.load_results.
+        cascade_df: results of a run with the cascade, None to decide the rows of judge_df with `cascade` instead.
+        cascade: Cascade replayed on judge_df when cascade_df is None, None for the default thresholds.
+        threshold: F1 from which a verdict counts as a match, a fast and a judge verdict agree when both are
+            matches or both mismatches.
+
+    Returns:
+        dict with the number of rows, the share of the rows decided by the fast tier (the judge calls saved),
+        the mean F1 of the cascade and of the judge, and the agreement, mean absolute F1 difference, false
+        matches and false mismatches of every tier and of the whole fast tier.
+    """
+    import numpy as np
+    judge_df = judge_df[judge_df["LLM F1"].notna()]
+    if cascade_df is not None:
+        merged = _join_runs(judge_df, cascade_df[cascade_df["LLM F1"].notna()])
+        tiers = (merged["LLM Tier Cascade"].fillna(JUDGE_TIER).tolist() if "LLM Tier Cascade" in merged.columns
+                 else [JUDGE_TIER] * len(merged))
+        cascade_f1 = merged["LLM F1 Cascade"].to_numpy(dtype=float)
+    else:
+        merged = judge_df.reset_index(drop=True)
+        cascade = cascade or Cascade()
+        tiers, cascade_f1 = [], merged["LLM F1"].to_numpy(dtype=float).copy()
+        for i, row in enumerate(merged.to_dict('records')):
+            decision = cascade.decide(row.get("Golden Response"), row.get("Candidate Response"), row)
+            tiers.append(decision[0] if decision is not None else JUDGE_TIER)
+            if decision is not None:
+                cascade_f1[i] = 1.0 if decision[1]["No of Common Claims"] else 0.0
+    judge_f1 = merged["LLM F1"].to_numpy(dtype=float)
+    tiers = np.array(tiers, dtype=object)
+
+    def agreement(mask, tier):
+        fast, full = cascade_f1[mask] >= threshold, judge_f1[mask] >= threshold
+        rows = int(mask.sum())
+        return {
+            "tier": tier,
+            "rows": rows,
+            "share": rows / max(len(tiers), 1),
+            "agreement": float((fast == full).mean()) if rows else None,
+            "mean_abs_error": float(np.abs(cascade_f1[mask] - judge_f1[mask]).mean()) if rows else None,
+            "false_matches": int((fast & ~full).sum()),
+            "false_mismatches": int((~fast & full).sum())
+        }
+
+    fast = tiers != JUDGE_TIER
+    return {
+        "rows": len(tiers),
+        "threshold": threshold,
+        "judge_calls_saved": float(fast.mean()) if len(tiers) else 0.0,
+        "mean_f1": {"cascade": float(cascade_f1.mean()) if len(tiers) else None,
+                    "judge": float(judge_f1.mean()) if len(tiers) else None},
+        "tiers": [agreement(tiers == tier, tier) for tier in CASCADE_TIERS if (tiers == tier).any()] + [agreement(fast, "fast")]
+    }
+
+def format_calibration(report):
+    """
+    Format a calibration report as a human readable table.
+    """
+    # the means and rates of no rows at all are None
+    value = lambda number, spec: "n/a" if number is None else format(number, spec)
+    lines = [f"{report['rows']} rows, {report['judge_calls_saved']:.1%} decided without the judge, "
+             f"mean LLM F1 {value(report['mean_f1']['cascade'], '.4f')} with the cascade and "
+             f"{value(report['mean_f1']['judge'], '.4f')} with the judge.",
+             f"{'tier':<12}{'rows':>8}{'share':>8}{'agree':>8}{'mae':>8}{'false match':>13}{'false mismatch':>16}"]
+    for row in report["tiers"]:
+        agree = value(row["agreement"], ".1%")
+        mae = value(row["mean_abs_error"], ".3f")
+        lines.append(f"{row['tier']:<12}{row['rows']:>8}{row['share']:>8.1%}{agree:>8}{mae:>8}"
+                     f"{row['false_matches']:>13}{row['false_mismatches']:>16}")
+    return "\n".join(lines)
@@ -0,0 +1,188 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib, json, logging, os, re
+
+# The source document of the benchmark is chunked and embedded once into a vector index. The index is memory-mapped
+# by the evaluation and every answer is compared with all the chunks with batched matrix products, without any
+# model call per row.
+
+INDEX_EMBEDDINGS = "embeddings.npy"
+INDEX_CHUNKS = "chunks.json"
+INDEX_META = "meta.json"
+
+def read_pdf_pages(pdf_file):
+    try:
+        import pypdf
+    except ImportError:
+        raise ImportError("Building a context index needs pypdf, install it with: pip install pypdf")
+    return [page.extract_text() or "" for page in pypdf.PdfReader(pdf_file).pages]
+
+def chunk_pages(pages, chunk_words=200, overlap=50):
+    """
+    Split the text of the pages into chunks of chunk_words words, overlapping by overlap words.
+
+    Returns:
+        list of dicts with the "text" of the chunk and the 1 based "page" it starts on.
+    """
+    words = [(word, page) for page, text in enumerate(pages, start=1) for word in text.split()]
+    step = max(1, chunk_words - overlap)
+    chunks = []
+    for start in range(0, max(1, len(words) - overlap), step):
+        window = words[start:start + chunk_words]
+        if window:
+            chunks.append({"text": " ".join(word for word, _ in window), "page": window[0][1]})
+    return chunks
+
+def normalize(embeddings):
+    import numpy as np
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+def build_index(pdf_file, index_dir, model_name="all-MiniLM-L6-v2", chunk_words=200, overlap=50, batch_size=64):
+    """
+    Chunk and embed a PDF document into a vector index directory.
+
+    Args:
+        pdf_file: source document of the benchmark.
+        index_dir: directory the index is saved to.
+        model_name: sentence transformers model embedding the chunks, the answers are embedded with the same model.
+        chunk_words: number of words of a chunk.
+        overlap: number of words shared by consecutive chunks.
+        batch_size: number of chunks per forward pass.
+    """
+    import numpy as np
+    import scoring_pool
+    with open(pdf_file, "rb") as f:
+        pdf_sha256 = hashlib.sha256(f.read()).hexdigest()
+    chunks = chunk_pages(read_pdf_pages(pdf_file), chunk_words, overlap)
+    logging.info(f"Embedding {len(chunks)} chunks of {pdf_file}.")
+    model = scoring_pool.load_model("similarity", model_name)
+    embeddings = normalize(scoring_pool.similarity_encode(model, [chunk["text"] for chunk in chunks], batch_size))
+
+    os.makedirs(index_dir, exist_ok=True)
+    meta = {"model": model_name, "pdf": os.path.basename(pdf_file), "pdf_sha256": pdf_sha256, "chunk_words": chunk_words,
+            "overlap": overlap, "chunks": len(chunks), "dim": int(embeddings.shape[1])}
+    # the files are replaced atomically so that a reader never sees a partially written index
+    for name, write in [(INDEX_EMBEDDINGS, lambda f: np.save(f, embeddings)),
+                        (INDEX_CHUNKS, lambda f: f.write(json.dumps(chunks).encode("utf-8"))),
+                        (INDEX_META, lambda f: f.write(json.dumps(meta, indent=4).encode("utf-8")))]:
+        path = os.path.join(index_dir, name)
+        with open(path + ".tmp", "wb") as f:
+            write(f)
+        os.replace(path + ".tmp", path)
+    logging.info(f"Context index saved to {index_dir}.")
+    return meta
+
+def split_sentences(text):
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence]
+
+class ContextIndex:
+    """
+    Memory-mapped vector index of the chunks of the source document.
+    """
+
+    def __init__(self, index_dir, block_size=4096):
+        """
+        Args:
+            index_dir: directory written by build_index.
+            block_size: number of query embeddings multiplied with the chunk embeddings at once, bounding the memory used.
+        """
+        import numpy as np
+        with open(os.path.join(index_dir, INDEX_META)) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, INDEX_CHUNKS)) as f:
+            self.chunks = json.load(f)
+        self.embeddings = np.load(os.path.join(index_dir, INDEX_EMBEDDINGS), mmap_mode="r")
+        if self.embeddings.shape != (self.meta["chunks"], self.meta["dim"]):
+            raise ValueError(f"The context index in {index_dir} is corrupted, rebuild it.")
+        self.model_name = self.meta["model"]
+        self.block_size = block_size
+
+    def search(self, queries, k):
+        """
+        Find the k chunks nearest to every query embedding.
+
+        Args:
+            queries: array of shape (queries, dim) of normalized embeddings.
+            k: number of chunks per query.
+
+        Returns:
+            the cosine similarities and the indices of the chunks, two arrays of shape (queries, k) sorted by
+            decreasing similarity.
+        """
+        import numpy as np
+        k = min(k, len(self.chunks))
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        for start in range(0, len(queries), self.block_size):
+            similarities = queries[start:start + self.block_size] @ self.embeddings.T
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(similarities, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            indices[start:start + self.block_size] = np.take_along_axis(top, order, axis=1)
+            scores[start:start + self.block_size] = np.take_along_axis(top_scores, order, axis=1)
+        return scores, indices
+
+def grounding_scores(index, encode, candidates, golden_contexts, k=5):
+    """
+    Compute the grounding metrics of the candidate responses against the source document.
+
+    Args:
+        index: ContextIndex of the source document.
+        encode: function returning the normalized embeddings of a list of texts, with the model of the index.
+        candidates: candidate responses.
+        golden_contexts: golden contexts of the benchmark, aligned with the candidates.
+        k: number of nearest chunks retrieved per text.
+
+    Returns:
+        dict of the metric columns:
+            "Context Support": mean over the sentences of the candidate of the similarity with their nearest chunk.
+            "Context Support Min": similarity of the least supported sentence, low values flag possible hallucinations.
+            "Golden Context Overlap": share of the k chunks nearest to the candidate that are also among the k chunks
+                nearest to the golden context.
+    """
+    import numpy as np
+    candidates = ["" if not isinstance(text, str) else text for text in candidates]
+    sentences = [split_sentences(text) for text in candidates]
+    flat = [sentence for row in sentences for sentence in row]
+    sentence_support = index.search(encode(flat), 1)[0][:, 0] if flat else np.empty(0, dtype=np.float32)
+    bounds = np.cumsum([0] + [len(row) for row in sentences])
+    support = [float(sentence_support[a:b].mean()) if b > a else None for a, b in zip(bounds[:-1], bounds[1:])]
+    support_min = [float(sentence_support[a:b].min()) if b > a else None for a, b in zip(bounds[:-1], bounds[1:])]
+
+    # every golden context is retrieved once even when it is shared by the candidates of several systems
+    contexts = [text if isinstance(text, str) and text.strip() else None for text in golden_contexts]
+    unique_contexts = list(dict.fromkeys(text for text in contexts if text is not None))
+    context_top = dict(zip(unique_contexts, index.search(encode(unique_contexts), k)[1])) if unique_contexts else {}
+    candidate_top = index.search(encode(candidates), k)[1]
+    valid = np.array([context is not None and bool(text.strip()) for text, context in zip(candidates, contexts)], dtype=bool)
+    overlap = [None] * len(candidates)
+    if valid.any():
+        golden_top = np.stack([context_top[context] for context, is_valid in zip(contexts, valid) if is_valid])
+        shared = (candidate_top[valid][:, :, None] == golden_top[:, None, :]).any(axis=2).sum(axis=1) / candidate_top.shape[1]
+        for row, value in zip(np.flatnonzero(valid), shared):
+            overlap[row] = float(value)
+    return {"Context Support": support, "Context Support Min": support_min, "Golden Context Overlap": overlap}
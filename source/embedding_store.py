@@ -0,0 +1,163 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib, json, logging, os, threading, time, zlib
+import numpy as np
+
+class EmbeddingStore:
+    """
+    Persistent store of embeddings keyed by model name and text hash.
+
+    Every entry is saved as its own `.npy` file and loaded memory-mapped, so cached vectors are read
+    without copying them into the Python heap. An index file keeps the shape, dtype and crc32 of every
+    entry to detect corrupted files, the crc32 of an entry is checked the first time this process reads
+    it. The least recently used entries are evicted once the store grows beyond `max_bytes`.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, store_dir, max_bytes=2 * 1024**3):
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = self.__load_index()
+        # running total of the sizes of the entries, and the entries whose crc32 this process checked already
+        self.total_bytes = sum(entry["nbytes"] for entry in self.index.values())
+        self.verified = set()
+
+    def __load_index(self):
+        path = os.path.join(self.store_dir, self.INDEX_FILE)
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logging.warning(f"Embedding store index {path} is corrupted, starting with an empty store.")
+            return {}
+
+    def save(self):
+        """
+        Persist the index. The index is written to a temporary file first so a crash never leaves it half written.
+        """
+        with self.lock:
+            path = os.path.join(self.store_dir, self.INDEX_FILE)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(self.index, file)
+            os.replace(tmp_path, path)
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.store_dir, key[:2], key + ".npy")
+
+    def get(self, model, text):
+        """
+        Return the memory-mapped array stored for the text, or None if it is missing or fails the integrity check.
+        """
+        key = self.make_key(model, text)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            try:
+                array = np.load(self.__path(key), mmap_mode='r')
+            except (OSError, ValueError):
+                array = None
+            if array is None or list(array.shape) != entry["shape"] or str(array.dtype) != entry["dtype"] \
+                    or (key not in self.verified and zlib.crc32(memoryview(array).cast('B')) != entry["crc32"]):
+                logging.warning(f"Embedding store entry {key} failed the integrity check, it will be recomputed.")
+                self.__remove(key)
+                return None
+            self.verified.add(key)
+            entry["last_used"] = time.time()
+            return array
+
+    def put(self, model, text, array):
+        """
+        Store the array for the text. The index is only persisted by `save`.
+        """
+        key = self.make_key(model, text)
+        array = np.ascontiguousarray(array)
+        path = self.__path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            np.save(file, array)
+        os.replace(tmp_path, path)
+        with self.lock:
+            if key in self.index:
+                self.total_bytes -= self.index[key]["nbytes"]
+            self.total_bytes += array.nbytes
+            self.verified.add(key)
+            self.index[key] = {
+                "shape": list(array.shape),
+                "dtype": str(array.dtype),
+                "nbytes": array.nbytes,
+                "crc32": zlib.crc32(memoryview(array).cast('B')),
+                "last_used": time.time()
+            }
+            self.__evict()
+
+    def get_or_compute(self, model, texts, compute_fn):
+        """
+        Return one array per text, computing only the missing ones.
+
+        Args:
+            model: name of the model the arrays belong to.
+            texts: list of texts.
+            compute_fn: called with the list of texts missing from the store, returns one array per text.
+        """
+        arrays = [self.get(model, text) for text in texts]
+        missing = list(dict.fromkeys(text for text, array in zip(texts, arrays) if array is None))
+        logging.debug(f"Embedding store {model}: {len(texts) - len(missing)} cached, {len(missing)} to compute.")
+        if missing:
+            computed = dict(zip(missing, compute_fn(missing)))
+            for text, array in computed.items():
+                self.put(model, text, array)
+            arrays = [computed[text] if array is None else array for text, array in zip(texts, arrays)]
+        self.save()
+        return arrays
+
+    def __remove(self, key):
+        entry = self.index.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry["nbytes"]
+        self.verified.discard(key)
+        try:
+            os.remove(self.__path(key))
+        except FileNotFoundError:
+            pass
+
+    def __evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key in sorted(self.index, key=lambda k: self.index[k]["last_used"]):
+            self.__remove(key)
+            if self.total_bytes <= self.max_bytes:
+                break
@@ -23,147 +23,718 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from nltk.translate.bleu_score import sentence_bleu
-from rouge_score import rouge_scorer
-import bert_score
-import pandas as pd
-from sentence_transformers import SentenceTransformer
-from nltk.translate.bleu_score import SmoothingFunction
-import time, json
-from utils import get_openai_response
-import logging, os
+import csv, hashlib, json, math, time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from judge import JudgeExecutor, JudgeError, EmptyResponseError, parse_json_response
+from cache import JudgeCache
+from instrumentation import Tracer
+from scoring_pool import load_model, MODEL_PRECISIONS
+from cascade import CASCADE_TIERS, JUDGE_TIER
+import sharding
+import logging, os, threading
+
+# torch, nltk, bert_score, sentence_transformers and pandas take seconds to import, they are imported
+# only by the metrics that need them so that e.g. a judge only evaluation starts immediately.
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+METRICS = ["llm", "bleu", "rouge", "bertscore", "similarity", "grounding"]
+# grounding needs a context index of the source document, it is only computed when requested
+DEFAULT_METRICS = ["llm", "bleu", "rouge", "bertscore", "similarity"]
+JUDGE_PROTOCOLS = ["single", "two-phase"]
+LLM_RESPONSE_KEYS = ["Golden Response Claims", "Candidate Response Claims", "Common Claims",
+                     "No of Golden Response Claims", "No of Candidate Response Claims", "No of Common Claims"]
+# the evaluation file is flushed after every row, and made durable on disk every few rows or seconds
+FSYNC_ROWS = 256
+FSYNC_SECONDS = 5.0
+LLM_COLUMNS = ["LLM Recall", "LLM Precision", "LLM F1", "Golden Response Claim Count", "Candidate Response Claim Count",
+               "Common Claim Count", "Golden Response Claims", "Candidate Response Claims", "Common Claims"]
+
 class Evaluate:
-    
-    def evaluate(self, response_file, eval_file):
+
+    def __init__(self, similarity_model="all-MiniLM-L6-v2", batch_size=64, concurrency=8, rpm=None, tpm=None, cache_dir=None,
+                 embedding_store_dir=None, embedding_store_bytes=2 * 1024**3, lexical_workers=None, metrics=None,
+                 tracer=None, judge_protocol="single", judge_pack_size=1, judge_timeout=60, judge_retries=5, judge_reasks=2,
+                 cpu_workers=1, torch_threads=None, context_index_dir=None, context_top_k=5, judge_backend=None,
+                 cascade=None, model_precision="fp32"):
         """
-        Evaluate response to a single question.
+        Args:
+            similarity_model: sentence-transformers model used for the similarity score.
+            batch_size: number of responses encoded per forward pass by the embedding and BERTScore models.
+            concurrency: maximum number of LLM judge requests in flight at the same time.
+            rpm: requests per minute limit for the LLM judge, None for no limit.
+            tpm: tokens per minute limit for the LLM judge, None for no limit.
+            cache_dir: directory of the LLM judge response cache, None to disable caching.
+            embedding_store_dir: directory of the golden response embedding store, None to disable it.
+            embedding_store_bytes: size above which the least recently used embeddings are evicted from the store.
+            lexical_workers: number of processes computing BLEU and ROUGE, None to use all the cores.
+            metrics: list of metrics to compute out of METRICS, None for DEFAULT_METRICS.
+            tracer: Tracer recording the timing and token usage of the run, a new one is created if None.
+            judge_protocol: "single" to let the judge decompose and match the claims of both responses in one call,
+                "two-phase" to extract the golden claims once per question and then only match the candidates against them.
+            judge_pack_size: number of rows evaluated by a single judge request with the "single" protocol, so that the
+                instructions are sent once for all of them. 1 sends a request per row.
+            judge_timeout: seconds to wait for a single judge request.
+            judge_retries: number of times a judge request is retried on rate limit, server, timeout and connection errors.
+            judge_reasks: number of times a prompt is sent again when the judge answers with malformed output. Rows
+                still without a valid answer get empty LLM columns and are marked failed.
+            cpu_workers: number of worker processes computing the BERTScore and similarity metrics, each with its own
+                copy of the models. 1 computes them in this process.
+            torch_threads: torch threads of every worker process, None to share the cores evenly between the workers.
+            context_index_dir: directory of the vector index of the source document built by context_index.build_index,
+                required by the grounding metric.
+            context_top_k: number of chunks of the source document retrieved per text by the grounding metric.
+            judge_backend: judge_backend.JudgeBackend the judge prompts are sent to, None for the OpenAI chat API.
+            cascade: cascade.Cascade deciding the rows with an obvious verdict without the judge, None to send every
+                row to the judge. The tier deciding every row is saved in the 'LLM Tier' column.
+            model_precision: CPU inference precision of the BERTScore and similarity models out of MODEL_PRECISIONS,
+                "int8" or "bf16" trade a small drift of the scores for speed, see model_drift.drift_report.
+        """
+        if model_precision not in MODEL_PRECISIONS:
+            raise ValueError(f"Unknown model precision '{model_precision}', valid precisions are {MODEL_PRECISIONS}.")
+        if judge_protocol not in JUDGE_PROTOCOLS:
+            raise ValueError(f"Unknown judge protocol '{judge_protocol}', valid protocols are {JUDGE_PROTOCOLS}.")
+        self.judge_protocol = judge_protocol
+        self.judge_pack_size = max(1, judge_pack_size)
+        self.metrics = list(DEFAULT_METRICS) if metrics is None else list(metrics)
+        unknown = set(self.metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics {sorted(unknown)}, valid metrics are {METRICS}.")
+        if "grounding" in self.metrics and not context_index_dir:
+            raise ValueError("The grounding metric needs a context index directory.")
+        self.context_index_dir = context_index_dir
+        self.context_top_k = context_top_k
+        self.__context_index = None
+        self.similarity_model = similarity_model
+        self.batch_size = batch_size
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.cache = JudgeCache(cache_dir) if cache_dir else None
+        self.judge = JudgeExecutor(concurrency=concurrency, rpm=rpm, tpm=tpm, cache=self.cache, tracer=self.tracer,
+                                   timeout=judge_timeout, max_retries=judge_retries, backend=judge_backend)
+        self.judge_reasks = max(0, judge_reasks)
+        self.cascade = cascade
+        self.embedding_store = None
+        if embedding_store_dir and ("bertscore" in self.metrics or "similarity" in self.metrics):
+            from embedding_store import EmbeddingStore
+            self.embedding_store = EmbeddingStore(embedding_store_dir, embedding_store_bytes)
+        self.lexical_workers = lexical_workers
+        # models are loaded on first use and then reused for every row of every run
+        self.__models = {}
+        self.cpu_workers = max(1, cpu_workers)
+        self.torch_threads = torch_threads
+        self.model_precision = model_precision
+        self.__scoring_pool = None
+        self.__lexical_pool = None
+        self.__golden_claims_memo = {}
+        self.__golden_claims_lock = threading.Lock()
+
+    def __get_model(self, name):
+        if name not in self.__models:
+            self.__models[name] = load_model(name, self.similarity_model, self.model_precision)
+        return self.__models[name]
+
+    def __get_scoring_pool(self):
+        # the workers are started on first use and then reused for every run
+        if self.__scoring_pool is None and self.cpu_workers > 1:
+            from scoring_pool import ScoringPool
+            models = [metric for metric in ["bertscore", "similarity"] if metric in self.metrics]
+            self.__scoring_pool = ScoringPool(self.cpu_workers, models, self.similarity_model, self.torch_threads,
+                                              self.model_precision)
+        return self.__scoring_pool
+
+    def __get_lexical_pool(self):
+        # created once, its workers are spawned on first use and then reused for every run
+        if self.__lexical_pool is None and self.lexical_workers != 1:
+            import lexical
+            self.__lexical_pool = lexical.make_pool(self.lexical_workers)
+        return self.__lexical_pool
+
+    def warm_up(self):
+        """
+        Load the models and libraries of the selected metrics up front, e.g. before serving requests.
+        """
+        if "bleu" in self.metrics or "rouge" in self.metrics:
+            import lexical
+        pool = self.__get_scoring_pool()
+        for name in ["bertscore", "similarity"]:
+            if name in self.metrics:
+                if pool is None:
+                    self.__get_model(name)
+                elif name == "bertscore":
+                    # waits for the workers to load their models
+                    pool.bertscore_hash
+        if "grounding" in self.metrics:
+            self.__get_context_model()
+        if "llm" in self.metrics:
+            self.judge.backend.warm_up()
+
+    def close(self):
+        """
+        Stop the scoring and lexical worker processes, close the connections of the judge and its cache.
+        """
+        self.judge.close()
+        if self.__scoring_pool is not None:
+            self.__scoring_pool.close()
+            self.__scoring_pool = None
+        if self.__lexical_pool is not None:
+            self.__lexical_pool.shutdown()
+            self.__lexical_pool = None
+        if self.cache is not None:
+            self.cache.close()
+
+    def fingerprints(self):
+        """
+        Fingerprints of the settings and of the judge prompts which the results depend on, results computed with
+        different fingerprints are not comparable.
+
+        Returns:
+            dict with the "config" and "prompts" sha256 hex digests.
+        """
+        config = {
+            "metrics": sorted(self.metrics),
+            "similarity_model": self.similarity_model,
+            "bertscore": {"lang": "en", "rescale_with_baseline": True},
+            "judge_model": self.judge.backend.model_id,
+            "judge_temperature": self.judge.backend.temperature,
+            "judge_protocol": self.judge_protocol,
+            "judge_pack_size": self.judge_pack_size
+        }
+        if self.cascade is not None:
+            config["cascade"] = self.cascade.settings
+        if self.model_precision != "fp32":
+            config["model_precision"] = self.model_precision
+        if "grounding" in self.metrics:
+            config["context_index"] = dict(self.__get_context_index().meta, top_k=self.context_top_k)
+        if self.judge_protocol == "two-phase":
+            prompts = [golden_claims_template, claim_matching_template]
+        else:
+            prompts = [prompt_template5] + ([packed_prompt_template, packed_item_template] if self.judge_pack_size > 1 else [])
+        digest = lambda value: hashlib.sha256(value.encode("utf-8")).hexdigest()
+        return {"config": digest(json.dumps(config, sort_keys=True)), "prompts": digest("\0".join(prompts))}
+
+    def evaluate(self, response_file, eval_file, resume=False, parquet_file=None):
+        """
+        Evaluate all the responses present in the response file.
 
         Args:
             response_file: temporary csv file generated with collated information from the benchmark file and the generated response file
             eval_file: csv file which would contain the final output of the evaluation result.
+            resume: skip the rows already present in eval_file and append the remaining ones to it.
+            parquet_file: optional Parquet file to also save the complete results to, with typed columns and the run metadata.
+        """
+        import pandas as pd
+        return self.evaluate_records(pd.read_csv(response_file), eval_file, resume, parquet_file)
+
+    def evaluate_records(self, records, eval_file=None, resume=False, parquet_file=None):
         """
-        df = pd.read_csv(response_file)
-
-        results = {
-            'bs': [],
-            'r1': [],
-            'rL': [],
-            'bert_p': [],
-            'bert_r': [],
-            'bert_f1': [],
-            'sim': [],
-            'llm_recall': [],
-            'llm_precision': [],
-            'llm_f1': [],
-            'g_cnt':[],
-            'cand_cnt':[],
-            'co_cnt':[],
-            'g_claims':[],
-            'cand_claims':[],
-            'co_claims':[]
+        Evaluate responses held in memory. When an evaluation file is given each row is appended to it as
+        soon as it is evaluated, so an interrupted run keeps all the rows completed so far.
+
+        Args:
+            records: DataFrame or iterable of dicts with the "SNo.", "Question", "Golden Context",
+                "Golden Response" and "Candidate Response" columns.
+            eval_file: csv file which would contain the final output of the evaluation result, None to only return it.
+            resume: skip the rows already present in eval_file and append the remaining ones to it.
+            parquet_file: optional Parquet file to also save the complete results to, with typed columns and the run
+                metadata, once all the rows are evaluated.
+
+        Returns:
+            DataFrame with the records evaluated in this call and their metrics.
+        """
+        import pandas as pd
+        started_at = datetime.now(timezone.utc).isoformat()
+        # the golden claims are only kept for the duration of a run, the judge cache keeps them across runs
+        with self.__golden_claims_lock:
+            self.__golden_claims_memo.clear()
+        df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(list(records))
+
+        # the same row keys as the merge of sharded runs
+        key_columns = sharding.key_columns(df)
+        if resume and eval_file and os.path.exists(eval_file) and os.path.getsize(eval_file) > 0:
+            header = self.__check_resumable(eval_file, key_columns, df.columns)
+            done = self.__resumed_rows(eval_file, key_columns)
+            logging.info(f"Resuming evaluation, {len(done)} rows already present in {eval_file}.")
+            df = df[[key not in done for key in df[key_columns].itertuples(index=False, name=None)]].reset_index(drop=True)
+        else:
+            resume = False
+            # the header is written with the first row
+            header = None
+            if eval_file:
+                self.__write_run_file(eval_file)
+
+        if df.empty:
+            logging.info("All rows are already evaluated.")
+            if parquet_file:
+                self.__write_parquet(parquet_file, eval_file, [], True, started_at)
+            return pd.DataFrame()
+
+        # all the metrics except the LLM judge are computed for all the rows at once
+        golden_resps = df["Golden Response"].tolist()
+        cand_resps = df["Candidate Response"].tolist()
+        row_ids = [self.__row_id(row) for row in df[key_columns].to_dict('records')]
+        columns = {}
+        if "bleu" in self.metrics or "rouge" in self.metrics:
+            import lexical
+            timings = []
+            lexical_scores = lexical.score_all(golden_resps, cand_resps, workers=self.lexical_workers, timings=timings,
+                                               pool=self.__get_lexical_pool())
+            for row_id, (bleu_seconds, rouge_seconds) in zip(row_ids, timings):
+                self.tracer.record("bleu", bleu_seconds, row=row_id)
+                self.tracer.record("rouge", rouge_seconds, row=row_id)
+            if "bleu" in self.metrics:
+                columns['Bleu Score'] = [scores[0] for scores in lexical_scores]
+            if "rouge" in self.metrics:
+                columns['Rouge-1'] = [scores[1] for scores in lexical_scores]
+                columns['Rouge-L'] = [scores[2] for scores in lexical_scores]
+        # the embedding based metrics run in batches, they are timed per batch of rows
+        if "bertscore" in self.metrics:
+            with self.tracer.span("bertscore", rows=len(df)):
+                columns['Bert Precision'], columns['Bert Recall'], columns['Bert Score F1'] = self.__evaluate_bertscore(golden_resps, cand_resps)
+        if "similarity" in self.metrics:
+            with self.tracer.span("similarity", rows=len(df)):
+                columns['Similarity Score'] = self.__evaluate_similarity(golden_resps, cand_resps)
+        if "grounding" in self.metrics:
+            with self.tracer.span("grounding", rows=len(df)):
+                columns.update(self.__evaluate_grounding(cand_resps, df["Golden Context"].tolist()))
+
+        rows = df.to_dict('records')
+        decisions = [None] * len(rows)
+        if "llm" in self.metrics and self.cascade is not None:
+            # the fast tier decides the obvious rows, only the other ones are sent to the judge
+            with self.tracer.span("cascade", rows=len(rows)):
+                decisions = [self.cascade.decide(row["Golden Response"], row["Candidate Response"],
+                                                 {column: values[i] for column, values in columns.items()})
+                             for i, row in enumerate(rows)]
+        judged_rows = [row for row, decision in zip(rows, decisions) if decision is None]
+        if "llm" in self.metrics and self.judge_protocol == "two-phase":
+            # extract the golden claims of every question up front, concurrently and once per question
+            golden = list(dict.fromkeys((row["Question"], row["Golden Response"]) for row in judged_rows))
+            for _ in self.judge.map(lambda pair: self.__golden_claims(*pair), golden):
+                pass
+        if "llm" in self.metrics and self.judge_protocol == "single" and self.judge_pack_size > 1:
+            packs = self.__packs(judged_rows)
+            llm_results = (result for pack_results in self.judge.map(self.__evaluate_pack_via_llm, packs) for result in pack_results)
+        elif "llm" in self.metrics:
+            # judge calls are kept in flight concurrently, results come back in row order
+            llm_results = self.judge.map(self.__evaluate_row_via_llm, judged_rows)
+        else:
+            llm_results = (None for _ in rows)
+        if self.cascade is not None and "llm" in self.metrics:
+            self.__log_cascade(decisions)
+            llm_results = self.__merge_cascade(decisions, llm_results)
+
+        failed = 0
+        with (open(eval_file, 'a' if resume else 'w', newline='') if eval_file else nullcontext()) as f:
+            writer = csv.writer(f, lineterminator='\n') if f is not None else None
+            unsynced, synced_at = 0, time.monotonic()
+            for i, llm_result in enumerate(llm_results):
+                row = rows[i]
+                for column, values in columns.items():
+                    row[column] = values[i]
+                if "llm" in self.metrics:
+                    # a row the judge could not evaluate keeps the same columns, empty, so the run goes on
+                    row.update(self.__llm_columns(*llm_result) if llm_result is not None else dict.fromkeys(LLM_COLUMNS))
+                    row['LLM Status'] = "ok" if llm_result is not None else "failed"
+                    if self.cascade is not None:
+                        row['LLM Tier'] = decisions[i][0] if decisions[i] is not None else JUDGE_TIER
+                    failed += llm_result is None
+                # progress is reported here, in row order, rather than by the judge threads
+                logging.info(f"Evaluated row {row_ids[i]} ({i + 1} of {len(rows)}).")
+
+                if writer is not None:
+                    # every row has the columns of the first one, in the order of the header
+                    if header is None:
+                        header = list(row)
+                        writer.writerow(header)
+                    elif i == 0 and set(row) != set(header):
+                        raise ValueError(f"Cannot resume {eval_file}: its columns {header} differ from the columns "
+                                         f"{list(row)} of this run, evaluate into a new file instead.")
+                    writer.writerow([_csv_value(row.get(column)) for column in header])
+                    # a crash of the process never loses a written row, the fsync covers a crash of the machine
+                    f.flush()
+                    unsynced += 1
+                    if unsynced >= FSYNC_ROWS or time.monotonic() - synced_at >= FSYNC_SECONDS:
+                        os.fsync(f.fileno())
+                        unsynced, synced_at = 0, time.monotonic()
+            if unsynced:
+                os.fsync(f.fileno())
+
+        if failed:
+            logging.warning(f"The judge failed to evaluate {failed} of {len(rows)} rows, they are marked failed in the 'LLM Status' column.")
+        if parquet_file:
+            self.__write_parquet(parquet_file, eval_file, rows, resume, started_at)
+        return pd.DataFrame(rows)
+
+    def __write_run_file(self, eval_file):
+        # the fingerprints of the run are saved next to the evaluation file, a resumed run must have the same ones
+        path = _run_file(eval_file)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"fingerprints": self.fingerprints()}, f)
+        os.replace(path + ".tmp", path)
+
+    def __check_resumable(self, eval_file, key_columns, input_columns):
+        """
+        Check that the rows of this run can be appended to the evaluation file of a previous run.
+
+        Returns:
+            the header of the evaluation file.
+
+        Raises:
+            ValueError: the previous run identified its rows by other key columns, had other input columns or
+                other fingerprints.
+        """
+        import pandas as pd
+        with open(eval_file, newline='') as f:
+            header = next(csv.reader(f))
+        previous_keys = sharding.key_columns(pd.DataFrame(columns=header))
+        if previous_keys != key_columns:
+            raise ValueError(f"Cannot resume {eval_file}: its rows are identified by {previous_keys} and the rows of "
+                             f"this run by {key_columns}, evaluate into a new file instead.")
+        missing = [column for column in input_columns if column not in header]
+        if missing:
+            raise ValueError(f"Cannot resume {eval_file}: it has no {missing} columns, evaluate into a new file instead.")
+        try:
+            with open(_run_file(eval_file)) as f:
+                previous = json.load(f)["fingerprints"]
+        except FileNotFoundError:
+            logging.warning(f"{eval_file} has no run file {_run_file(eval_file)}, the settings of the previous run cannot be checked.")
+            return header
+        for name, fingerprint in self.fingerprints().items():
+            if previous.get(name) != fingerprint:
+                raise ValueError(f"Cannot resume {eval_file}: the {name} fingerprint differs from the previous run, "
+                                 f"which was evaluated with different {name}. Evaluate into a new file instead.")
+        return header
+
+    def __resumed_rows(self, eval_file, key_columns):
+        """
+        Keys of the rows of a previous run to skip when resuming. The rows the judge failed to evaluate are
+        removed from the evaluation file, so that they are evaluated again and appended like the missing ones.
+        """
+        import pandas as pd
+        previous = pd.read_csv(eval_file, usecols=lambda column: column in key_columns or column == "LLM Status",
+                               dtype={"System Id": str})
+        failed = (previous["LLM Status"] == "failed") if "LLM Status" in previous.columns else pd.Series(False, index=previous.index)
+        if failed.any():
+            # the other rows are copied unchanged, the file is replaced atomically so that a crash never loses them
+            with open(eval_file, newline='') as f:
+                reader = csv.reader(f)
+                lines = [next(reader)] + [line for line, drop in zip(reader, failed) if not drop]
+            tmp_path = eval_file + ".tmp"
+            with open(tmp_path, 'w', newline='') as f:
+                csv.writer(f, lineterminator='\n').writerows(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, eval_file)
+            logging.info(f"Evaluating again the {int(failed.sum())} rows the judge failed to evaluate in {eval_file}.")
+        return set(previous.loc[~failed, key_columns].itertuples(index=False, name=None))
+
+    def __merge_cascade(self, decisions, judge_results):
+        # the verdicts of the fast tier in place of the judge results, in row order
+        for decision in decisions:
+            yield self.__llm_result(decision[1]) if decision is not None else next(judge_results)
+
+    def __log_cascade(self, decisions):
+        tiers = [decision[0] for decision in decisions if decision is not None]
+        counts = ", ".join(f"{tier}: {tiers.count(tier)}" for tier in CASCADE_TIERS if tier in tiers)
+        logging.info(f"The fast tier decided {len(tiers)} of {len(decisions)} rows ({counts or 'none'}), "
+                     f"{len(decisions) - len(tiers)} rows are sent to the judge.")
+
+    def __write_parquet(self, parquet_file, eval_file, rows, resumed, started_at):
+        import pandas as pd
+        import result_store
+        # when resuming, the rows of the previous runs are only in the evaluation file
+        results = (pd.read_csv(eval_file, dtype={"System Id": str}, float_precision="round_trip") if resumed and eval_file
+                   else pd.DataFrame(rows))
+        metadata = {
+            "judge_model": self.judge.backend.model_id,
+            "judge_temperature": self.judge.backend.temperature,
+            "judge_protocol": self.judge_protocol,
+            "similarity_model": self.similarity_model,
+            "metrics": self.metrics,
+            "fingerprints": self.fingerprints(),
+            "rows": len(results),
+            "started_at": started_at,
+            "finished_at": datetime.now(timezone.utc).isoformat()
         }
+        result_store.write_parquet(results, parquet_file, metadata)
+        logging.info(f"Results saved to {parquet_file}.")
 
-        for index, row in df.iterrows():
-            print("Response:",row["SNo."])
-
-            question = row["Question"]
-            golden_resp = row["Golden Response"]
-            cand_resp = row["Candidate Response"]
-
-            bs, r1, rL, bert_p, bert_r, bert_f1 = self.__evaluate_metrics(golden_resp,cand_resp)
-            sim = self.__evaluate_similarity([golden_resp],[cand_resp])
-            results['bs'].append(bs)
-            results['r1'].append(r1)
-            results['rL'].append(rL)
-            results['bert_p'].append(bert_p)
-            results['bert_r'].append(bert_r)
-            results['bert_f1'].append(bert_f1)
-            results['sim'].append(sim)
-
-            llm_recall, llm_precision, llm_f1, llm_response = self.evaluate_via_llm(question, golden_resp, cand_resp)
-            results['llm_recall'].append(llm_recall)
-            results['llm_precision'].append(llm_precision)
-            results['llm_f1'].append(llm_f1)
-            g_claims = llm_response["Golden Response Claims"]
-            cand_claims = llm_response["Candidate Response Claims"]
-            co_claims = llm_response["Common Claims"]
-            g_cnt = llm_response["No of Golden Response Claims"]
-            cand_cnt = llm_response["No of Candidate Response Claims"]
-            co_cnt = llm_response["No of Common Claims"]
-            # this means that the candidate claims cover all the common claims which are part of the 
-            # golden claims.
-            if co_cnt > cand_cnt:
-                cand_cnt = co_cnt
-            results['g_claims'].append(g_claims)
-            results['cand_claims'].append(cand_claims)
-            results['co_claims'].append(co_claims)
-            results['g_cnt'].append(g_cnt)
-            results['cand_cnt'].append(cand_cnt)
-            results['co_cnt'].append(co_cnt)                        
-            
-        df['Bleu Score'] = results['bs']
-        df['Rouge-1'] = results['r1']
-        df['Rouge-L'] = results['rL']
-        df['Bert Precision'] = results['bert_p']
-        df['Bert Recall'] = results['bert_r']
-        df['Bert Score F1'] = results['bert_f1']
-        df['Similarity Score'] = results['sim']
-        df['LLM Recall'] = results['llm_recall']
-        df['LLM Precision'] = results['llm_precision']
-        df['LLM F1'] = results['llm_f1']
-        df['Golden Response Claim Count'] = results['g_cnt']
-        df['Candidate Response Claim Count'] = results['cand_cnt']
-        df['Common Claim Count'] = results['co_cnt']
-        df['Golden Response Claims'] = results['g_claims']
-        df['Candidate Response Claims'] = results['cand_claims']
-        df['Common Claims'] = results['co_claims']
-        
-        df.to_csv(eval_file, index=False)
+    def __llm_columns(self, llm_recall, llm_precision, llm_f1, llm_response):
+        g_cnt = llm_response["No of Golden Response Claims"]
+        cand_cnt = llm_response["No of Candidate Response Claims"]
+        co_cnt = llm_response["No of Common Claims"]
+        # this means that the candidate claims cover all the common claims which are part of the 
+        # golden claims.
+        if co_cnt > cand_cnt:
+            cand_cnt = co_cnt
+        return {
+            'LLM Recall': llm_recall,
+            'LLM Precision': llm_precision,
+            'LLM F1': llm_f1,
+            'Golden Response Claim Count': g_cnt,
+            'Candidate Response Claim Count': cand_cnt,
+            'Common Claim Count': co_cnt,
+            'Golden Response Claims': llm_response["Golden Response Claims"],
+            'Candidate Response Claims': llm_response["Candidate Response Claims"],
+            'Common Claims': llm_response["Common Claims"]
+        }
     
-    def __evaluate_similarity(self, reference_sentence,candidate_sentence):
-        model = SentenceTransformer("all-MiniLM-L6-v2")
+    def __reference_features(self, model_name, references, encode):
+        # every golden response is encoded once even when it is compared with the candidates of several systems
+        unique = list(dict.fromkeys(references))
+        # golden responses do not change between runs, their features are reused from the store
+        if self.embedding_store is None:
+            features = list(encode(unique))
+        else:
+            # the features of a lower precision model are stored apart from the reference fp32 ones
+            model_key = model_name if self.model_precision == "fp32" else f"{model_name}:{self.model_precision}"
+            features = self.embedding_store.get_or_compute(model_key, unique, encode)
+        features = dict(zip(unique, features))
+        return [features[reference] for reference in references]
+
+    def __evaluate_similarity(self, reference_sentences, candidate_sentences):
+        import numpy as np
+        import torch
+        pool = self.__get_scoring_pool()
+        if pool is None:
+            import scoring_pool
+            model = self.__get_model("similarity")
+            encode = lambda sentences: scoring_pool.similarity_encode(model, sentences, self.batch_size)
+            similarity_pairwise = lambda embeddings1, embeddings2: model.similarity_pairwise(embeddings1, embeddings2).tolist()
+        else:
+            encode = lambda sentences: pool.similarity_encode(sentences, self.batch_size)
+            similarity_pairwise = pool.similarity_pairwise
         # Compute embeddings for both lists
-        embeddings1 = model.encode(reference_sentence)
-        embeddings2 = model.encode(candidate_sentence)
-        # Compute cosine similarities
-        similarities = model.similarity(embeddings1, embeddings2)
-        return similarities[0][0].item()
+        embeddings1 = torch.from_numpy(np.stack(self.__reference_features(self.similarity_model, reference_sentences, encode)))
+        embeddings2 = torch.from_numpy(encode(candidate_sentences))
+        # Compute cosine similarity of each reference with its own candidate
+        return similarity_pairwise(embeddings1, embeddings2)
+
+    def __get_context_index(self):
+        if self.__context_index is None:
+            import context_index
+            self.__context_index = context_index.ContextIndex(self.context_index_dir)
+        return self.__context_index
+
+    def __get_context_model(self):
+        # the answers are embedded with the model of the index, in fp32 like the index itself, shared with the
+        # similarity metric only when it is the same model at the same precision
+        model_name = self.__get_context_index().model_name
+        if model_name == self.similarity_model and self.model_precision == "fp32":
+            return self.__get_model("similarity")
+        if "context" not in self.__models:
+            self.__models["context"] = load_model("similarity", model_name)
+        return self.__models["context"]
+
+    def __evaluate_grounding(self, candidates, golden_contexts):
+        import context_index
+        import scoring_pool
+        index = self.__get_context_index()
+        model = self.__get_context_model()
+        encode = lambda texts: context_index.normalize(scoring_pool.similarity_encode(model, texts, self.batch_size))
+        return context_index.grounding_scores(index, encode, candidates, golden_contexts, self.context_top_k)
+
+    def __evaluate_bertscore(self, references, candidates):
+        import bertscore_features
+        import numpy as np
+        pool = self.__get_scoring_pool()
+        if pool is None:
+            scorer = self.__get_model("bertscore")
+            encode = lambda sentences: bertscore_features.encode(scorer, sentences, self.batch_size)
+            score = lambda ref_features, cand_features: bertscore_features.score(scorer, ref_features, cand_features, self.batch_size)
+            model_hash = scorer.hash
+        else:
+            encode = lambda sentences: pool.bertscore_encode(sentences, self.batch_size)
+            score = lambda ref_features, cand_features: pool.bertscore_score(ref_features, cand_features, self.batch_size)
+            model_hash = pool.bertscore_hash
+        ref_features = self.__reference_features(model_hash, references, encode)
+        P, R, F1 = score(ref_features, encode(candidates))
+        logging.debug(f'BERT Precision: {np.mean(P):.4f}')
+        logging.debug(f'BERT Recall: {np.mean(R):.4f}')
+        logging.debug(f'BERT F1: {np.mean(F1):.4f}')
+        return P, R, F1
+
+    def __row_id(self, row):
+        if "System Id" in row:
+            return f'{row["System Id"]}:{row["SNo."]}'
+        return row["SNo."]
+
+    def __evaluate_row_via_llm(self, row):
+        with self.tracer.row(self.__row_id(row)):
+            return self.evaluate_via_llm(row["Question"], row["Golden Response"], row["Candidate Response"])
 
-    def __evaluate_metrics(self, reference, candidate):
-        
-        # Calculate BLEU score
-        ref_bleu = reference.split()
-        cand_bleu = candidate.split()
-        chencherry = SmoothingFunction()
-        bleu_score = sentence_bleu([ref_bleu], cand_bleu, smoothing_function=chencherry.method1)
-        logging.debug(f'BLEU score: {bleu_score:.4f}')
-
-        # Calculate ROUGE score
-        scorer = rouge_scorer.RougeScorer(['rouge1', 'rougeL'], use_stemmer=True)
-        scores = scorer.score(reference, candidate)
-        logging.debug(f'ROUGE-1 score: {scores["rouge1"].fmeasure:.4f}')
-        logging.debug(f'ROUGE-L score: {scores["rougeL"].fmeasure:.4f}')
-
-        # Calculate BERT score
-        P, R, F1 = bert_score.score([candidate], [reference], lang="en", rescale_with_baseline=True)
-        logging.debug(f'BERT Precision: {P.mean().item():.4f}')
-        logging.debug(f'BERT Recall: {R.mean().item():.4f}')
-        logging.debug(f'BERT F1: {F1.mean().item():.4f}')
-
-        return bleu_score, scores["rouge1"].fmeasure, scores["rougeL"].fmeasure, P.item(), R.item(), F1.item()
-    
     def evaluate_via_llm(self, question, golden_response, candidate_response):
         """
         Evaluate response to a single question.
 
         Args:
-            response_file: temporary csv file generated with collated information from the benchmark file and the generated response file
-            eval_file: csv file which would contain the final output of the evaluation result.
+            question: the benchmark question.
+            golden_response: the golden response of the benchmark.
+            candidate_response: the response of the RAG system.
+
+        Returns:
+            recall, precision, f1 and the judge response, None if the judge failed to evaluate the responses.
+        """
+        if self.judge_protocol == "two-phase":
+            json_response = self.__evaluate_claims_two_phase(question, golden_response, candidate_response)
+        else:
+            json_response = self.__ask_judge(prompt_template5.format(question, golden_response, candidate_response),
+                                             self.__is_valid_llm_response)
+        if json_response is None:
+            return
+        return self.__llm_result(json_response)
+
+    def __llm_result(self, json_response):
+        golden_cnt = json_response["No of Golden Response Claims"]
+        candidate_cnt = json_response["No of Candidate Response Claims"]
+        common_cnt = json_response["No of Common Claims"]
+        # this means that the cnadidate claims cover all the common claims which are part of the 
+        # golden claims.
+        if common_cnt > candidate_cnt:
+            candidate_cnt = common_cnt
+        recall, precision, f1 = self.__calculate_llm_metrics(golden_cnt, candidate_cnt, common_cnt)
+
+        return recall, precision, f1, json_response
+
+    def __packs(self, rows):
+        """
+        Split the rows into packs of at most judge_pack_size rows, in row order. Besides full packs, a pack ends
+        at every row whose question hash is a multiple of four times the pack size, instead of every judge_pack_size
+        rows: a row added to or removed from the judged rows, e.g. decided by the cascade in one run and not in
+        the next, then only changes the packs up to the next such row and the other packs still hit the cache.
+        """
+        packs = [[]]
+        for row in rows:
+            if len(packs[-1]) == self.judge_pack_size:
+                packs.append([])
+            packs[-1].append(row)
+            digest = hashlib.sha256(str(row["Question"]).encode("utf-8")).digest()
+            if int.from_bytes(digest[:8], "big") % (4 * self.judge_pack_size) == 0:
+                packs.append([])
+        return [pack for pack in packs if pack]
+
+    def __evaluate_pack_via_llm(self, rows):
         """
-        prompt_template5 = """
+        Evaluate several rows with a single judge request. Items missing from the response or malformed
+        are evaluated again with a single item request.
+        """
+        item_ids = [f"item_{i + 1}" for i in range(len(rows))]
+        items = "".join(packed_item_template.format(item_id, row["Question"], row["Golden Response"], row["Candidate Response"], item_id)
+                        for item_id, row in zip(item_ids, rows))
+        with self.tracer.row(",".join(str(self.__row_id(row)) for row in rows)):
+            json_response = self.__ask_judge(packed_prompt_template.format(len(rows), items),
+                                             lambda response: any(self.__is_valid_llm_response(response.get(item_id)) for item_id in item_ids))
+
+        results = []
+        for item_id, row in zip(item_ids, rows):
+            item = json_response.get(item_id) if isinstance(json_response, dict) else None
+            if self.__is_valid_llm_response(item):
+                results.append(self.__llm_result(item))
+            else:
+                logging.info(f"Packed judge response has no valid result for row {self.__row_id(row)}, evaluating it on its own.")
+                results.append(self.__evaluate_row_via_llm(row))
+        return results
+
+    def __is_valid_llm_response(self, item):
+        if not isinstance(item, dict) or any(key not in item for key in LLM_RESPONSE_KEYS):
+            return False
+        counts = [item[key] for key in LLM_RESPONSE_KEYS[3:]]
+        return all(isinstance(count, (int, float)) and count >= 0 for count in counts) and counts[0] > 0
+
+    def __golden_claims(self, question, golden_response):
+        # phase one of the two-phase protocol, the golden claims are extracted once per question
+        key = (question, golden_response)
+        with self.__golden_claims_lock:
+            if key in self.__golden_claims_memo:
+                return self.__golden_claims_memo[key]
+        json_response = self.__ask_judge(golden_claims_template.format(question, golden_response),
+                                         lambda response: isinstance(response.get("Golden Response Claims"), (dict, list))
+                                                          and len(response["Golden Response Claims"]) > 0)
+        if json_response is None:
+            return None
+        claims = json_response["Golden Response Claims"]
+        with self.__golden_claims_lock:
+            self.__golden_claims_memo[key] = claims
+        return claims
+
+    def __evaluate_claims_two_phase(self, question, golden_response, candidate_response):
+        golden_claims = self.__golden_claims(question, golden_response)
+        if golden_claims is None:
+            return None
+        # phase two only matches the candidate against the stored golden claims
+        json_response = self.__ask_judge(claim_matching_template.format(question, json.dumps(golden_claims, indent=4), candidate_response),
+                                         lambda response: all(key in response for key in LLM_RESPONSE_KEYS[1:3])
+                                                          and all(isinstance(response.get(key), (int, float)) for key in LLM_RESPONSE_KEYS[4:]))
+        if json_response is None:
+            return None
+        golden_cnt = len(golden_claims)
+        return {
+            "Golden Response Claims": golden_claims,
+            "Candidate Response Claims": json_response["Candidate Response Claims"],
+            "Common Claims": json_response["Common Claims"],
+            "No of Golden Response Claims": golden_cnt,
+            "No of Candidate Response Claims": json_response["No of Candidate Response Claims"],
+            "No of Common Claims": min(json_response["No of Common Claims"], golden_cnt)
+        }
+
+    def __ask_judge(self, prompt, is_valid=None):
+        """
+        Send a prompt to the judge and parse its JSON answer. Malformed answers are asked again, without the
+        cache, up to judge_reasks times.
+
+        Args:
+            prompt: prompt sent to the judge.
+            is_valid: optional check of the parsed answer, answers failing it are asked again as well.
+
+        Returns:
+            the parsed answer, None if the request failed or the answer is still empty or malformed.
+        """
+        logging.debug(f"Prompt:\n{prompt}")
+        for attempt in range(self.judge_reasks + 1):
+            try:
+                response = self.judge.complete(prompt, refresh=attempt > 0)
+            except EmptyResponseError as e:
+                logging.warning(f"{e} (attempt {attempt + 1} of {self.judge_reasks + 1})")
+                self.tracer.record("judge_reask", 0, retries=1)
+                continue
+            except JudgeError as e:
+                logging.error(str(e))
+                return None
+            logging.debug(f"Response:\n{response}")
+            with self.tracer.span("json_extraction"):
+                json_response = parse_json_response(response)
+            if isinstance(json_response, dict) and (is_valid is None or is_valid(json_response)):
+                return json_response
+            logging.warning(f"Malformed judge response (attempt {attempt + 1} of {self.judge_reasks + 1}): {response!r:.200}")
+            self.tracer.record("judge_reask", 0, retries=1)
+        return None
+
+    def __calculate_llm_metrics(self, golden_cnt, candidate_cnt, common_cnt):
+        recall = common_cnt/golden_cnt
+        if candidate_cnt == 0:
+            precision = 0
+        else:
+            precision = common_cnt/candidate_cnt
+        if precision == 0 or recall == 0:
+            f1 = 0
+        else:
+            f1 = (2*recall*precision)/(precision+recall)
+        return recall, precision, f1
+
+
+def _run_file(eval_file):
+    return eval_file + ".run.json"
+
+def _csv_value(value):
+    # the values formatted as pandas.DataFrame.to_csv does, missing values are left empty
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return "" if math.isnan(value) else repr(float(value))
+    return value
+
+prompt_template5 = """
             Given the following question:
 
             ###  Start Question:
@@ -236,63 +807,6 @@ class Evaluate:
 
             """
 
-        prompt = prompt_template5.format(question, golden_response, candidate_response)
-        logging.debug("Prompt:\n",prompt)
-        response = get_openai_response(prompt)
-        json_response = None
-        try:
-            logging.debug("\nResponse before extract:\n",response)
-            response = self.__extract_json(response)
-            logging.debug("\nResponse after extract:\n",response)
-            json_response = json.loads(response)
-            logging.debug(json_response)
-        except json.JSONDecodeError as e:
-            print("Failed to decode JSON:", e)
-            print("Raw output:", response)
-            return
-
-        if json_response is None or json_response == '':
-            print("Empty response\n")
-            exit(1)
-        
-        logging.debug("Response:\n", response)
-
-        golden_cnt = json_response["No of Golden Response Claims"]
-        candidate_cnt = json_response["No of Candidate Response Claims"]
-        common_cnt = json_response["No of Common Claims"]
-        # this means that the cnadidate claims cover all the common claims which are part of the 
-        # golden claims.
-        if common_cnt > candidate_cnt:
-            candidate_cnt = common_cnt
-        recall, precision, f1 = self.__calculate_llm_metrics(golden_cnt, candidate_cnt, common_cnt)
-        
-        time.sleep(1)
-
-        return recall, precision, f1, json_response
-
-    def __calculate_llm_metrics(self, golden_cnt, candidate_cnt, common_cnt):
-        recall = common_cnt/golden_cnt
-        if candidate_cnt == 0:
-            precision = 0
-        else:
-            precision = common_cnt/candidate_cnt
-        if precision == 0 or recall == 0:
-            f1 = 0
-        else:
-            f1 = (2*recall*precision)/(precision+recall)
-        return recall, precision, f1
-
-    def __extract_json(self, response):
-            start_tag = '```json'
-            end_tag = '```'
-            start_tag_idx = response.find(start_tag)
-            end_tag_idx = response.rfind(end_tag)
-            if start_tag_idx != -1 and end_tag_idx != -1:
-                return response[start_tag_idx+len(start_tag):end_tag_idx].strip()
-            else:
-                return response
-
-
 prompt_template4 = """
             Given the following question:
 
@@ -440,3 +954,179 @@ prompt_template3 = """
         Precision:
         F1:
         """
+
+golden_claims_template = """
+            Given the following question:
+
+            ###  Start Question:
+            {}
+            End Question
+
+            and a golden response.
+
+            ### Start Golden Response:
+            {}
+            End Golden Response
+
+            ### Create a list of individual claims that can be inferred from the golden response with respect to the question.
+            The response could be numerical, specific (e.g., names or dates), or descriptive.
+
+            ### For creating the individual claims follow the following instructions:
+             - Decompose the "Content" into clear and simple propositions, ensuring they are interpretable out of context.
+             - Split compound sentence into simple sentences. Maintain the original phrasing from the input whenever possible.
+             - For any named entity that is accompanied by additional descriptive information, separate this information into its own distinct proposition.
+             - Decontextualize the proposition by adding necessary modifier to nouns or entire sentences and replacing pronouns (e.g., "it", "he", "she", "they", "this", "that") with the full name of the entities they refer to.
+
+            ### After creating the list, if any claim can be directly inferred from the question only then remove it from the list.
+
+            ### The final output should contain the numerical value in the following json format:
+
+            {{
+                "Golden Response Claims": {{ <list of claims from the golden response> }},
+                "No of Golden Response Claims": <value>
+            }}
+
+            ### Example:
+            {{
+                "Golden Response Claims": {{
+                                                "1": The Mac line includes laptops.,
+                                                "2": The laptops mentioned are MacBook Air and MacBook Pro.,
+                                                "3": The Mac line includes desktops.,
+                                                "4": The desktops mentioned are iMac, Mac mini, Mac Studio, and Mac Pro.
+                                            }},
+                "No of Golden Response Claims": 4
+            }}
+
+            ### Please strictly adhere to the json format specified above. please provide the complete response
+            in json format.
+
+            """
+
+claim_matching_template = """
+            Given the following question:
+
+            ###  Start Question:
+            {}
+            End Question
+
+            and the claims of a golden response and a candidate response respectively.
+
+            ### Start Golden Response Claims:
+            {}
+            End Golden Response Claims
+
+            ### Start Candidate Response:
+            {}
+            End Candidate Response
+
+            ### Evaluate the candidate response using the Evaluation Method below.
+            The responses could be numerical, specific (e.g., names or dates), or descriptive.
+
+            ### Evaluation Method:
+            1. Create a list of individual claims that can be inferred from the candidate response with respect to the question.
+            2. Calculate the total number of the golden response claims present in the candidate response based on the following rules:
+                - the complete statement of each golden response claim should be checked against the complete statement of each claim in candidate response.
+                - If the golden response claim is specific in nature like numerical, names or dates then the candidate response claim should contains the exact value present in the golden response claim.
+
+            ### For creating the individual claims follow the following instructions:
+             - Decompose the "Content" into clear and simple propositions, ensuring they are interpretable out of context.
+             - Split compound sentence into simple sentences. Maintain the original phrasing from the input whenever possible.
+             - For any named entity that is accompanied by additional descriptive information, separate this information into its own distinct proposition.
+             - Decontextualize the proposition by adding necessary modifier to nouns or entire sentences and replacing pronouns (e.g., "it", "he", "she", "they", "this", "that") with the full name of the entities they refer to.
+
+            ### After creating the list, if any candidate response claim can be directly inferred from the question, only then remove it from the list.
+
+            ### The final output should contain the numerical value in the following json format:
+
+            {{
+                "Candidate Response Claims": {{ <list of claims from the candidate response> }},
+                "Common Claims": {{ <list of golden response claims present in candidate > }},
+                "No of Candidate Response Claims": <value>,
+                "No of Common Claims": <value>
+            }}
+
+            ### Please strictly adhere to the json format specified above. please provide the complete response
+            in json format.
+
+            """
+
+packed_prompt_template = """
+            You are given {} items below. Each item has an Item ID, a question, a golden response and a candidate response.
+            {}
+            ### Evaluate the two responses of every item independently using the Evaluation Method below.
+            The responses could be numerical, specific (e.g., names or dates), or descriptive.
+
+            ### Evaluation Method:
+            1. Create a list of individual claims that can be inferred from the golden response with respect to the question.
+            2. Create a list of individual claims that can be inferred from the candidate response with respect to the question.
+            3. Calculate the total number of claims of the golden response present in the candidate response based on the following rules:
+                - the complete statement of each claim in golden response should be checked against the complete statement of each claim in candidate response. 
+                - If the golden response claim is specific in nature like numerical, names or dates then the candidate response claim should contains the exact value present in the golden response.
+            
+            ### For creating the individual claims follow the following instructions:
+             - Decompose the "Content" into clear and simple propositions, ensuring they are interpretable out of context.
+             - Split compound sentence into simple sentences. Maintain the original phrasing from the input whenever possible.
+             - For any named entity that is accompanied by additional descriptive information, separate this information into its own distinct proposition.
+             - Decontextualize the proposition by adding necessary modifier to nouns or entire sentences and replacing pronouns (e.g., "it", "he", "she", "they", "this", "that") with the full name of the entities they refer to.
+
+            ### After creating the list, perform the following:
+            1. In the golden response claims, if any claim can be directly inferred from the question only then remove it from the list.
+            2. In the candidate repsonse claims, if any claim can be directly inferred from the question, only then remove it from the list.
+            
+            ### The final output should contain one entry per Item ID with the numerical values in the following json format:
+            
+            {{
+                "<Item ID>": {{
+                    "Golden Response Claims": {{ <list of claims from the golden response> }},
+                    "Candidate Response Claims": {{ <list of claims from the candidate response> }},
+                    "Common Claims": {{ <list of claims from golden response present in candidate > }},
+                    "No of Golden Response Claims": <value>,
+                    "No of Candidate Response Claims": <value>,
+                    "No of Common Claims": <value>
+                }}
+            }}
+            
+            ### Example:
+            {{
+                "item_1": {{
+                    "Golden Response Claims": {{ 
+                                                    "1": The Mac line includes laptops.,
+                                                    "2": The laptops mentioned are MacBook Air and MacBook Pro.,
+                                                    "3": The Mac line includes desktops.,
+                                                    "4": The desktops mentioned are iMac, Mac mini, Mac Studio, and Mac Pro.
+                                                }},
+                    "Candidate Response Claims":   {{
+                                                    "1": The company's line of personal computers is called Mac.,
+                                                    "2": It includes laptops.,
+                                                    "3": The laptops included are MacBook Air and MacBook Pro.,
+                                                    "4": It includes desktops.,
+                                                    "5": The desktops included are iMac, Mac mini, Mac Studio, and Mac Pro.,
+                                                    }},
+                    "No of Golden Response Claims": 4,
+                    "No of Candidate Response Claims": 5,
+                    "No of Common Claims": 4
+                }}
+            }}
+
+            ### Please strictly adhere to the json format specified above and include every Item ID. please provide the complete response
+            in json format.
+
+            """
+
+packed_item_template = """
+            ### Start Item ID: {}
+
+            ###  Start Question:
+            {}
+            End Question
+
+            ### Start Golden Response:
+            {}
+            End Golden Response
+
+            ### Start Candidate Response:
+            {}
+            End Candidate Response
+
+            End Item ID: {}
+            """
@@ -0,0 +1,157 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json, math, os, threading, time
+from contextlib import contextmanager
+
+# counters summed per stage in the run summary when present in the events
+COUNTERS = ["rows", "prompts", "prompt_tokens", "completion_tokens", "retries", "cache_hits"]
+
+class Tracer:
+    """
+    Collects per-row and per-stage timing, token usage and retry events of an evaluation run. Events are
+    recorded from the judge threads as well, the row an event belongs to is bound per thread with `row`.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @contextmanager
+    def row(self, row_id):
+        """
+        Attribute the events recorded by the current thread inside the block to the given row.
+        """
+        previous = getattr(self.local, "row", None)
+        self.local.row = row_id
+        try:
+            yield
+        finally:
+            self.local.row = previous
+
+    def record(self, stage, seconds, row=None, **fields):
+        event = {"stage": stage, "row": row if row is not None else getattr(self.local, "row", None), "seconds": seconds}
+        event.update(fields)
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """
+        Record the time spent in the block. The yielded dict can be used to add fields to the event.
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(stage, time.perf_counter() - start, **fields)
+
+    def reset(self):
+        """
+        Discard the events recorded so far, e.g. after every batch of a long running server.
+        """
+        with self.lock:
+            self.events = []
+
+    def summary(self):
+        """
+        Return the count, total time, p50/p95/p99 latencies and summed counters of every stage.
+        """
+        with self.lock:
+            events = list(self.events)
+        stages = {}
+        for event in events:
+            stages.setdefault(event["stage"], []).append(event)
+
+        summary = {}
+        for stage, stage_events in stages.items():
+            seconds = sorted(event["seconds"] for event in stage_events)
+            stats = {
+                "count": len(seconds),
+                "total_seconds": sum(seconds),
+                "p50_seconds": percentile(seconds, 50),
+                "p95_seconds": percentile(seconds, 95),
+                "p99_seconds": percentile(seconds, 99)
+            }
+            for counter in COUNTERS:
+                values = [event[counter] for event in stage_events if event.get(counter) is not None]
+                if values:
+                    stats[counter] = sum(values)
+            summary[stage] = stats
+        return summary
+
+    def write_trace(self, path):
+        """
+        Write every event as a line of JSON.
+        """
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as file:
+            for event in events:
+                file.write(json.dumps(event, default=str) + "\n")
+
+    def write_prometheus(self, path):
+        """
+        Write the summary in the Prometheus text format, e.g. for the node exporter textfile collector.
+        """
+        lines = [
+            "# HELP dataworkz_eval_stage_seconds Time spent per evaluation stage.",
+            "# TYPE dataworkz_eval_stage_seconds summary"
+        ]
+        summary = self.summary()
+        for stage, stats in summary.items():
+            for quantile in (50, 95, 99):
+                lines.append(f'dataworkz_eval_stage_seconds{{stage="{stage}",quantile="{quantile / 100}"}} {stats[f"p{quantile}_seconds"]}')
+            lines.append(f'dataworkz_eval_stage_seconds_sum{{stage="{stage}"}} {stats["total_seconds"]}')
+            lines.append(f'dataworkz_eval_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for counter in COUNTERS:
+            if any(counter in stats for stats in summary.values()):
+                lines.append(f"# TYPE dataworkz_eval_{counter}_total counter")
+                for stage, stats in summary.items():
+                    if counter in stats:
+                        lines.append(f'dataworkz_eval_{counter}_total{{stage="{stage}"}} {stats[counter]}')
+        # the collector may read the file at any time, it is replaced atomically
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+def percentile(sorted_values, q):
+    # nearest rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def format_summary(summary):
+    """
+    Format a Tracer summary as a human readable table.
+    """
+    lines = [f"{'stage':<18}{'count':>8}{'total s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  counters"]
+    for stage, stats in summary.items():
+        counters = ", ".join(f"{counter}={stats[counter]}" for counter in COUNTERS if counter in stats)
+        lines.append(f"{stage:<18}{stats['count']:>8}{stats['total_seconds']:>10.2f}{stats['p50_seconds'] * 1000:>10.1f}"
+                     f"{stats['p95_seconds'] * 1000:>10.1f}{stats['p99_seconds'] * 1000:>10.1f}  {counters}")
+    return "\n".join(lines)
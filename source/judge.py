@@ -0,0 +1,312 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import ast, json, random, re, threading, time, logging
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import Tracer
+
+class TokenBucket:
+    """
+    Thread safe token bucket which refills continuously at `rate_per_minute` and holds
+    at most one minute worth of tokens.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # a single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+class JudgeError(Exception):
+    """
+    Raised when a judge request still fails after all its retries, or fails with an error that is not retried.
+    """
+
+class EmptyResponseError(JudgeError):
+    """
+    Raised when the judge answers a request without any content, e.g. a chat message without content or a
+    batch missing the choice of a prompt.
+    """
+
+class _Request:
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.response = None
+        self.error = None
+        self.done = threading.Event()
+
+class _BatchCollector:
+    """
+    Collects the prompts sent concurrently by several threads into batches. The first thread of a batch waits
+    until the batch is full or `max_wait` seconds passed, sends it and hands the answers to the other threads.
+    """
+
+    def __init__(self, send, max_batch, max_wait):
+        self.send = send
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self.batch = []
+
+    def submit(self, prompt):
+        request = _Request(prompt)
+        with self.condition:
+            batch = self.batch
+            batch.append(request)
+            leader = len(batch) == 1
+            if len(batch) >= self.max_batch:
+                # the next prompts start a new batch
+                self.batch = []
+                self.condition.notify_all()
+            if leader:
+                deadline = time.monotonic() + self.max_wait
+                while self.batch is batch and deadline > time.monotonic():
+                    self.condition.wait(deadline - time.monotonic())
+                if self.batch is batch:
+                    self.batch = []
+        if leader:
+            try:
+                responses = self.send([queued.prompt for queued in batch])
+                for queued, response in zip(batch, responses):
+                    queued.response = response
+            except Exception as e:
+                for queued in batch:
+                    queued.error = e
+            finally:
+                for queued in batch:
+                    queued.done.set()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.response
+
+class JudgeExecutor:
+    """
+    Runs LLM judge calls concurrently while respecting requests-per-minute and tokens-per-minute limits.
+    """
+
+    def __init__(self, concurrency=8, rpm=None, tpm=None, cache=None, tracer=None, timeout=60, max_retries=5,
+                 backoff=1.0, max_backoff=60.0, backend=None, batch_wait=0.05):
+        """
+        Args:
+            concurrency: maximum number of judge requests in flight at the same time.
+            rpm: requests per minute allowed by the API, None for no limit.
+            tpm: tokens per minute allowed by the API, None for no limit.
+            cache: optional JudgeCache consulted before sending a prompt to the API.
+            tracer: Tracer recording the latency and token usage of every call.
+            timeout: seconds to wait for a single request, None to wait forever.
+            max_retries: number of times a request is retried on rate limit (429), server (5xx), timeout and connection errors.
+            backoff: seconds to wait before the first retry, doubled on every following retry.
+            max_backoff: upper bound in seconds of the wait between retries.
+            backend: JudgeBackend the prompts are sent to, None for the OpenAI chat API. With a backend answering
+                several prompts per request, the prompts sent concurrently are batched, so `concurrency` should be
+                a multiple of its batch size.
+            batch_wait: seconds a batch waits for more prompts before being sent with fewer than the batch size.
+        """
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache = cache
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        if backend is None:
+            from judge_backend import OpenAIChatBackend
+            backend = OpenAIChatBackend(max_connections=self.concurrency)
+        self.backend = backend
+        self.batcher = _BatchCollector(self.__send_batch, backend.max_batch, batch_wait) if backend.max_batch > 1 else None
+
+    def complete(self, prompt, refresh=False):
+        """
+        Send a single prompt to the judge once the rate limits allow it. Cached responses are
+        returned without calling the API.
+
+        Args:
+            prompt: prompt sent to the judge.
+            refresh: skip the cached response, e.g. because it was malformed, and replace it with the new one.
+
+        Raises:
+            JudgeError: the request failed after all its retries.
+            EmptyResponseError: the judge answered without any content, such answers are never cached.
+        """
+        start = time.perf_counter()
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(prompt, self.backend.model_id, self.backend.temperature)
+            response = None if refresh else self.cache.get(key)
+            if response is not None:
+                self.tracer.record("judge", time.perf_counter() - start, cache_hits=1)
+                return response
+        if self.batcher is not None:
+            response = self.batcher.submit(prompt)
+        else:
+            response = self.__send([prompt], lambda prompts: self.backend.complete(prompts[0], timeout=self.timeout))
+        if response is None or not response.strip():
+            raise EmptyResponseError("Judge returned an empty response.")
+        if self.cache is not None:
+            self.cache.put(key, response)
+        return response
+
+    def __send_batch(self, prompts):
+        return self.__send(prompts, lambda prompts: self.backend.complete_batch(prompts, timeout=self.timeout))
+
+    def __send(self, prompts, request):
+        # a batch counts as a single request for the requests per minute limit
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            if self.request_bucket is not None:
+                self.request_bucket.acquire()
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(sum(estimate_tokens(prompt) for prompt in prompts))
+            # rate limit waits are recorded separately from the latency of the API
+            self.tracer.record("judge_rate_limit", time.perf_counter() - start)
+            start = time.perf_counter()
+            try:
+                response, usage = request(prompts)
+                break
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise JudgeError(f"Judge request failed: {e}") from e
+                if attempt == self.max_retries:
+                    raise JudgeError(f"Judge request failed after {self.max_retries} retries: {e}") from e
+                wait = self.__retry_wait(attempt, e)
+                logging.warning(f"Judge request failed ({e}), retrying in {wait:.1f}s.")
+                self.tracer.record("judge_retry", time.perf_counter() - start, retries=1)
+                time.sleep(wait)
+        self.tracer.record("judge", time.perf_counter() - start, retries=0, cache_hits=0, prompts=len(prompts), **usage)
+        return response
+
+    def close(self):
+        """
+        Close the connections of the backend.
+        """
+        self.backend.close()
+
+    def __retry_wait(self, attempt, error):
+        # exponential backoff with full jitter so that concurrent requests do not retry in lockstep
+        wait = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        # honour the wait requested by the API on rate limit errors
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            wait = max(wait, min(self.max_backoff, float(headers.get("retry-after", 0))))
+        except (TypeError, ValueError):
+            pass
+        return wait
+
+    def map(self, fn, items):
+        """
+        Apply `fn` to every item using up to `concurrency` threads. Results are yielded in the order of `items`,
+        each one as soon as it and all the results before it are available.
+        """
+        items = list(items)
+        if self.concurrency == 1 or len(items) <= 1:
+            for item in items:
+                yield fn(item)
+            return
+        logging.debug(f"Running {len(items)} judge calls with concurrency {self.concurrency}.")
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            yield from pool.map(fn, items)
+
+def _is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    import openai
+    return isinstance(error, (openai.APITimeoutError, openai.APIConnectionError))
+
+def parse_json_response(response):
+    """
+    Extract the JSON object of a judge response, repairing the common ways LLMs deviate from strict JSON:
+    markdown fences, text around the object, trailing commas, single quotes, Python literals and unquoted
+    keys or string values.
+
+    Returns:
+        the parsed object, None if the response is empty or could not be repaired.
+    """
+    if not response or not response.strip():
+        return None
+    text = response.strip()
+    fence = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    if fence:
+        text = fence.group(1).strip()
+    # drop any explanation before and after the outermost object
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        text = text[start:end + 1]
+    for candidate in (text, _repair_json(text)):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+def _repair_json(text):
+    text = text.replace("\u201c", '"').replace("\u201d", '"').replace("\u2018", "'").replace("\u2019", "'")
+    lines = []
+    for line in text.splitlines():
+        # `key: value` lines, with the key and/or the value left unquoted as in the example of the prompt
+        match = re.match(r'^(\s*)"?([^"{}\[\]:]+?)"?\s*:\s*(.*?)\s*(,?)\s*$', line)
+        if match:
+            indent, key, value, comma = match.groups()
+            if value and not value.startswith(("{", "[")) and not _is_json_value(value.rstrip(",")):
+                value = json.dumps(value.rstrip(","))
+            line = f'{indent}{json.dumps(key.strip())}: {value}{comma}'
+        lines.append(line)
+    text = "\n".join(lines)
+    # trailing commas before a closing bracket
+    return re.sub(r",\s*([}\]])", r"\1", text)
+
+def _is_json_value(text):
+    # claims like `2022 net sales were $394.3 billion.` start like a number but are prose to quote
+    try:
+        json.loads(text)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+def estimate_tokens(text):
+    # roughly 4 characters per token for english text
+    return max(1, len(text) // 4)
@@ -0,0 +1,209 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, threading
+from utils import OPENAI_MODEL, OPENAI_TEMPERATURE
+
+# Backends of the LLM judge. JudgeExecutor takes care of the caching, rate limits, retries and concurrency,
+# a backend only sends prompts to a model server and returns the content and token usage of its answers.
+
+JUDGE_BACKENDS = ["chat", "completions"]
+
+class JudgeBackend:
+    """
+    Interface of the LLM judge backends.
+    """
+
+    # number of prompts sent together by complete_batch, 1 for backends answering one prompt per request
+    max_batch = 1
+
+    def __init__(self, model, temperature=OPENAI_TEMPERATURE):
+        self.model = model
+        self.temperature = temperature
+
+    @property
+    def model_id(self):
+        """
+        Identity of the judge model in the cache keys and the run fingerprints.
+        """
+        return self.model
+
+    def complete(self, prompt, timeout=None):
+        """
+        Returns the content of the answer and its token usage as a dict with the prompt_tokens and completion_tokens keys.
+
+        Args:
+            prompt: prompt sent to the model.
+            timeout: seconds to wait for the answer, None for the default of the backend.
+        """
+        raise NotImplementedError
+
+    def complete_batch(self, prompts, timeout=None):
+        """
+        Returns the contents of the answers of several prompts, in the order of the prompts, and the token
+        usage of all of them.
+        """
+        answers = [self.complete(prompt, timeout) for prompt in prompts]
+        usage = {key: sum(answer[1].get(key) or 0 for answer in answers) for key in ["prompt_tokens", "completion_tokens"]}
+        return [answer[0] for answer in answers], usage
+
+    def warm_up(self):
+        """
+        Load the client libraries up front, e.g. before serving requests.
+        """
+
+    def close(self):
+        pass
+
+class OpenAIChatBackend(JudgeBackend):
+    """
+    Judge served by the OpenAI API, or by any server implementing its chat completions endpoint such as vLLM,
+    llama.cpp or Ollama on a local node.
+    """
+
+    def __init__(self, model=OPENAI_MODEL, base_url=None, api_key=None, temperature=OPENAI_TEMPERATURE,
+                 connect_timeout=10, max_connections=32):
+        """
+        Args:
+            model: name of the model on the server.
+            base_url: url of the OpenAI compatible API, e.g. http://localhost:8000/v1, None for the OpenAI API.
+            api_key: key of the API, None to read it from the OPENAI_API_KEY environment variable. Local servers
+                usually do not check it.
+            temperature: sampling temperature of the judge.
+            connect_timeout: seconds to wait for a connection to the server.
+            max_connections: size of the pool of connections kept open to the server and shared by all the requests.
+        """
+        super().__init__(model, temperature)
+        self.base_url = base_url
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+        self.max_connections = max(1, max_connections)
+        self.__client = None
+        self.__lock = threading.Lock()
+
+    @property
+    def model_id(self):
+        # the same model name served elsewhere may be a different build or quantization of the model
+        return self.model if self.base_url is None else f"{self.model}@{self.base_url}"
+
+    @property
+    def client(self):
+        # a single client is shared by the threads of the executor, so the connections are reused between requests
+        with self.__lock:
+            if self.__client is None:
+                # imported on first use, it takes a noticeable time to load
+                import httpx, openai
+                api_key = self.api_key or os.environ.get("OPENAI_API_KEY") or ("none" if self.base_url else None)
+                limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+                # the executor retries the failed requests itself, with its own backoff and rate limits
+                self.__client = openai.OpenAI(api_key=api_key, base_url=self.base_url, max_retries=0,
+                                              http_client=openai.DefaultHttpxClient(limits=limits))
+            return self.__client
+
+    def warm_up(self):
+        self.client
+
+    def _timeout(self, timeout):
+        if timeout is None:
+            return None
+        import httpx
+        return httpx.Timeout(timeout, connect=min(timeout, self.connect_timeout))
+
+    def complete(self, prompt, timeout=None):
+        options = {} if timeout is None else {"timeout": self._timeout(timeout)}
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            **options
+        )
+        return response.choices[0].message.content, _usage(response)
+
+    def close(self):
+        with self.__lock:
+            if self.__client is not None:
+                self.__client.close()
+                self.__client = None
+
+class OpenAICompletionsBackend(OpenAIChatBackend):
+    """
+    Judge served by the completions endpoint of an OpenAI compatible server, which takes a list of prompts and
+    answers all of them in one request. Servers like vLLM generate them in a single batch. The prompts are sent
+    as they are, without the chat template of the model.
+    """
+
+    def __init__(self, model, base_url, api_key=None, temperature=OPENAI_TEMPERATURE, connect_timeout=10,
+                 max_connections=32, max_batch=16, max_tokens=2048):
+        """
+        Args:
+            max_batch: number of prompts sent in a single request.
+            max_tokens: maximum number of tokens generated per prompt, the endpoint defaults to very few.
+            See OpenAIChatBackend for the other arguments.
+        """
+        super().__init__(model, base_url, api_key, temperature, connect_timeout, max_connections)
+        self.max_batch = max(1, max_batch)
+        self.max_tokens = max_tokens
+
+    def complete(self, prompt, timeout=None):
+        contents, usage = self.complete_batch([prompt], timeout)
+        return contents[0], usage
+
+    def complete_batch(self, prompts, timeout=None):
+        options = {} if timeout is None else {"timeout": self._timeout(timeout)}
+        response = self.client.completions.create(
+            model=self.model,
+            prompt=list(prompts),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            **options
+        )
+        contents = [None] * len(prompts)
+        for choice in response.choices:
+            contents[choice.index] = choice.text
+        return contents, _usage(response)
+
+def _usage(response):
+    return {
+        "prompt_tokens": getattr(response.usage, "prompt_tokens", None),
+        "completion_tokens": getattr(response.usage, "completion_tokens", None)
+    }
+
+def make_backend(kind="chat", model=None, base_url=None, api_key=None, temperature=OPENAI_TEMPERATURE,
+                 connect_timeout=10, max_connections=32, max_batch=16):
+    """
+    Create a judge backend.
+
+    Args:
+        kind: "chat" for the chat completions endpoint, "completions" for the batched completions endpoint of a
+            local server, which needs a base url and a model.
+        model: name of the model, None for OPENAI_MODEL with the chat endpoint.
+        See OpenAIChatBackend and OpenAICompletionsBackend for the other arguments.
+    """
+    if kind not in JUDGE_BACKENDS:
+        raise ValueError(f"Unknown judge backend '{kind}', valid backends are {JUDGE_BACKENDS}.")
+    if kind == "completions":
+        if not base_url or not model:
+            raise ValueError("The completions judge backend needs the base url of the server and the model.")
+        return OpenAICompletionsBackend(model, base_url, api_key, temperature, connect_timeout, max_connections, max_batch)
+    return OpenAIChatBackend(model or OPENAI_MODEL, base_url, api_key, temperature, connect_timeout, max_connections)
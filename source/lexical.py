@@ -0,0 +1,134 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import logging, multiprocessing, time
+from nltk.stem import porter
+from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
+from rouge_score import scoring, tokenize
+from rouge_score.rouge_scorer import _create_ngrams, _score_ngrams
+
+# Lexical metrics (BLEU, ROUGE-1 and ROUGE-L) computed with the same tokenization and scoring functions as
+# nltk and rouge_score.RougeScorer(['rouge1', 'rougeL'], use_stemmer=True), but tokenizing and stemming each
+# text only once and sharing the stems across rows.
+
+_smoothing = SmoothingFunction().method1
+
+class _CachedStemmer:
+    def __init__(self):
+        self.stem = lru_cache(maxsize=None)(porter.PorterStemmer().stem)
+
+_stemmer = _CachedStemmer()
+
+@lru_cache(maxsize=100000)
+def _bleu_tokens(text):
+    return text.split()
+
+@lru_cache(maxsize=100000)
+def _rouge_tokens(text):
+    return tokenize.tokenize(text, _stemmer)
+
+def _lcs_length(ref_tokens, cand_tokens):
+    # bit-parallel longest common subsequence length (Hyyro 2004), exact and much faster than the
+    # dynamic programming table built by rouge_score for long responses
+    matches = {}
+    for i, token in enumerate(ref_tokens):
+        matches[token] = matches.get(token, 0) | (1 << i)
+    mask = (1 << len(ref_tokens)) - 1
+    v = mask
+    for token in cand_tokens:
+        u = v & matches.get(token, 0)
+        v = ((v + u) | (v - u)) & mask
+    return len(ref_tokens) - v.bit_count()
+
+def _score_lcs(ref_tokens, cand_tokens):
+    # same as rouge_score.rouge_scorer._score_lcs
+    if not ref_tokens or not cand_tokens:
+        return scoring.Score(precision=0, recall=0, fmeasure=0)
+    lcs_length = _lcs_length(ref_tokens, cand_tokens)
+    precision = lcs_length / len(cand_tokens)
+    recall = lcs_length / len(ref_tokens)
+    return scoring.Score(precision=precision, recall=recall, fmeasure=scoring.fmeasure(precision, recall))
+
+def score(reference, candidate):
+    """
+    Compute BLEU, ROUGE-1 and ROUGE-L of a candidate against its reference.
+    """
+    return _timed_score(reference, candidate)[0]
+
+def _timed_score(reference, candidate):
+    start = time.perf_counter()
+    bleu_score = sentence_bleu([_bleu_tokens(reference)], _bleu_tokens(candidate), smoothing_function=_smoothing)
+    bleu_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    ref_tokens = _rouge_tokens(reference)
+    cand_tokens = _rouge_tokens(candidate)
+    rouge1 = _score_ngrams(_create_ngrams(ref_tokens, 1), _create_ngrams(cand_tokens, 1))
+    rougeL = _score_lcs(ref_tokens, cand_tokens)
+    rouge_seconds = time.perf_counter() - start
+    return (bleu_score, rouge1.fmeasure, rougeL.fmeasure), (bleu_seconds, rouge_seconds)
+
+def _score_chunk(pairs):
+    return [_timed_score(reference, candidate) for reference, candidate in pairs]
+
+def make_pool(workers=None):
+    """
+    Create a pool of worker processes to pass to score_all, so that several calls reuse the same workers. They
+    are spawned rather than forked, forking a process running torch or HTTP client threads is not safe.
+
+    Args:
+        workers: number of worker processes, None to use all the cores. They are started on first use.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def score_all(references, candidates, workers=None, chunk_size=256, timings=None, pool=None):
+    """
+    Compute BLEU, ROUGE-1 and ROUGE-L for every reference/candidate pair.
+
+    Args:
+        references: list of reference texts.
+        candidates: list of candidate texts.
+        workers: number of worker processes, None to use all the cores. Small inputs are scored in process.
+        chunk_size: number of pairs sent to a worker at a time.
+        timings: optional list extended with the (bleu_seconds, rouge_seconds) of every pair.
+        pool: pool created by make_pool scoring the chunks, None to create one for this call only.
+
+    Returns:
+        list of (bleu, rouge1, rougeL) tuples in the order of the input.
+    """
+    pairs = list(zip(references, candidates))
+    if workers == 1 or len(pairs) <= chunk_size:
+        results = _score_chunk(pairs)
+    else:
+        chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+        logging.debug(f"Scoring {len(pairs)} pairs in {len(chunks)} chunks.")
+        if pool is None:
+            with make_pool(workers) as pool:
+                results = [result for chunk in pool.map(_score_chunk, chunks) for result in chunk]
+        else:
+            results = [result for chunk in pool.map(_score_chunk, chunks) for result in chunk]
+    if timings is not None:
+        timings.extend(pair_timings for _, pair_timings in results)
+    return [scores for scores, _ in results]
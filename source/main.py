@@ -22,9 +22,14 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from evaluate import Evaluate
-from utils import extract_response, get_golden_response, write_answers_to_csv, read_openai_key
-import argparse, logging, os
+from evaluate import Evaluate, METRICS, DEFAULT_METRICS, JUDGE_PROTOCOLS
+from instrumentation import format_summary
+from sharding import parse_shard, select_shard, data_fingerprint, write_shard_metadata, merge_shards
+from judge_backend import JUDGE_BACKENDS, make_backend
+from cascade import Cascade
+from scoring_pool import MODEL_PRECISIONS
+from utils import group_responses_by_system, get_golden_response, collate_systems, to_wide_results, read_openai_key, OPENAI_MODEL
+import argparse, json, logging, os
     
 def evaluate_results(args):
     """
@@ -33,23 +38,143 @@ def evaluate_results(args):
         Args:
             args: Contains all file names to be used for evaluation
     """
-    
-    response_file = './data/apple10k_collected_response.csv'
+
     #Pre-processing
-    # Extract answers and write to CSV
-    question,cand_resp = extract_response(args.dataworkz_response_file, "question :","answer :","links :")
-    golden_resp,golden_ctxt = get_golden_response(args.benchmark)
+    # Extract answers of every system and collate them with the benchmark
+    systems = group_responses_by_system(args.dataworkz_response_file)
+    golden_resp,golden_ctxt = get_golden_response(args.benchmark, None if args.no_cache else args.cache_dir)
 
-    logging.debug("question:{}, golden response:{}, golden context:{}, candidate response:{}".format(len(question),len(golden_resp),len(golden_ctxt),len(cand_resp)))
-    write_answers_to_csv(question, golden_ctxt, golden_resp, cand_resp, response_file)
+    for system_id, system in systems.items():
+        logging.debug("system:{}, question:{}, golden response:{}, golden context:{}, candidate response:{}".format(
+            system["name"],len(system["questions"]),len(golden_resp),len(golden_ctxt),len(system["answers"])))
+    records = collate_systems(systems, golden_ctxt, golden_resp)
+    if args.shard:
+        total_rows, fingerprint = len(records), data_fingerprint(records)
+        records, positions = select_shard(records, *args.shard)
+        logging.info(f"Shard {args.shard[0]}/{args.shard[1]}: {len(records)} of {total_rows} rows.")
 
-    logging.debug(f"Intermediate response file saved to {response_file}.")
+    if args.collected_response_file:
+        records.to_csv(args.collected_response_file, index=False)
+        logging.debug(f"Intermediate response file saved to {args.collected_response_file}.")
     logging.info("Extraction Successful.")
 
-    eval = Evaluate()
-    eval.evaluate(response_file, args.evaluation_file)
+    eval = _make_evaluator(args)
+    if args.shard:
+        write_shard_metadata(args.evaluation_file, *args.shard, records, positions, total_rows,
+                             dict(eval.fingerprints(), data=fingerprint))
+    try:
+        eval.evaluate_records(records, args.evaluation_file, resume=args.resume, parquet_file=args.parquet_file)
+    except ValueError as e:
+        # e.g. resuming an evaluation file written with other settings
+        logging.error(str(e))
+        exit(1)
+    if args.wide_evaluation_file:
+        import pandas as pd
+        if len(systems) > 1:
+            to_wide_results(pd.read_csv(args.evaluation_file)).to_csv(args.wide_evaluation_file, index=False)
+        else:
+            logging.warning("A single system was evaluated, the wide evaluation file is not written.")
+    if eval.cache is not None:
+        logging.info(f"Judge cache: {eval.cache.hits} hits, {eval.cache.misses} misses.")
+
+    print(format_summary(eval.tracer.summary()))
+    if args.trace_file:
+        eval.tracer.write_trace(args.trace_file)
+        logging.info(f"Trace saved to {args.trace_file}.")
+    if args.prometheus_file:
+        eval.tracer.write_prometheus(args.prometheus_file)
+    eval.close()
     logging.info("Evaluation completed successfully.")
 
+def merge_results(args):
+    """
+        Merge the evaluation files of the shards of a run.
+
+        Args:
+            args: Contains the shard evaluation files and the merged evaluation file names
+    """
+    try:
+        merged = merge_shards(args.shard_files)
+    except ValueError as e:
+        logging.error(str(e))
+        exit(1)
+    merged.to_csv(args.evaluation_file, index=False)
+    logging.info(f"Merged evaluation saved to {args.evaluation_file}.")
+    if args.wide_evaluation_file:
+        if "System Name" in merged.columns:
+            to_wide_results(merged).to_csv(args.wide_evaluation_file, index=False)
+        else:
+            logging.warning("A single system was evaluated, the wide evaluation file is not written.")
+
+def build_context_index(args):
+    """
+        Chunk and embed the source document of the benchmark into a vector index.
+
+        Args:
+            args: Contains the pdf file, the index directory and the chunking settings
+    """
+    from context_index import build_index
+    meta = build_index(args.pdf, args.index_dir, args.model, args.chunk_words, args.chunk_overlap)
+    logging.info(f"Indexed {meta['chunks']} chunks of {args.pdf} into {args.index_dir}.")
+
+def report_results(args):
+    """
+        Summarize evaluation results with bootstrap confidence intervals.
+
+        Args:
+            args: Contains the result files and the bootstrap settings
+    """
+    from report import load_results, bootstrap_report, format_report
+    metrics = [metric.strip() for metric in args.metrics.split(",")] if args.metrics else None
+    report = bootstrap_report(load_results(args.result_files, metrics), metrics, resamples=args.resamples,
+                              confidence=args.confidence, seed=args.seed)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        logging.info(f"Report saved to {args.output}.")
+
+def calibrate_cascade(args):
+    """
+        Compare the verdicts of the cascade with the ones of the judge.
+
+        Args:
+            args: Contains the evaluation files of the runs with and without the cascade
+    """
+    from report import load_results
+    from cascade import CALIBRATION_COLUMNS, calibration_report, format_calibration
+    judge_df = load_results([args.judge_file], CALIBRATION_COLUMNS)
+    cascade_df = load_results([args.cascade_file], CALIBRATION_COLUMNS) if args.cascade_file else None
+    cascade = Cascade(similarity_low=args.cascade_similarity[0], similarity_high=args.cascade_similarity[1])
+    report = calibration_report(judge_df, cascade_df, cascade, threshold=args.threshold)
+    print(format_calibration(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        logging.info(f"Calibration report saved to {args.output}.")
+
+def report_drift(args):
+    """
+        Compare the scores and throughput of lower precision models with the fp32 ones.
+
+        Args:
+            args: Contains the rows to score, the precision and the accuracy bound
+    """
+    import pandas as pd
+    from model_drift import drift_report, format_drift
+    records = pd.read_csv(args.response_file)
+    if args.rows:
+        records = records.head(args.rows)
+    report = drift_report(records, args.model_precision, args.metrics, batch_size=args.batch_size, max_drift=args.max_drift)
+    print(format_drift(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        logging.info(f"Drift report saved to {args.output}.")
+    if not report["passed"]:
+        logging.error(f"Scores drift by more than {args.max_drift} from the fp32 ones.")
+        exit(1)
+
 def _disp_response(llm_response):
     g_claims = llm_response["Golden Response Claims"]
     cand_claims = llm_response["Candidate Response Claims"]
@@ -74,16 +199,124 @@ def evaluate_question(args):
             args: Contains a single question, its corresponding golden answer and candidate answer for evaluation
     """
 
-    recall, precision, f1, response = eval.evaluate_via_llm(args.question, args.golden_response, args.candidate_response)
+    if args.server:
+        # the server keeps its models, judge client and caches warm between the calls
+        import urllib.error
+        from server import request_evaluation, server_error
+        try:
+            result = request_evaluation(args.server, [{"question": args.question, "golden_response": args.golden_response,
+                                                       "candidate_response": args.candidate_response}])[0]
+        except urllib.error.HTTPError as e:
+            logging.error(f"The evaluation server at {args.server} answered {e.code}: {server_error(e)}")
+            exit(1)
+        except (urllib.error.URLError, TimeoutError) as e:
+            logging.error(f"Could not reach the evaluation server at {args.server}: {getattr(e, 'reason', e)}")
+            exit(1)
+        if result.get("LLM Status") == "failed":
+            logging.error("The judge failed to evaluate the candidate response.")
+            exit(1)
+        print("Golden Claims:\n",result.get("Golden Response Claims"))
+        print("Candidate Claims:\n",result.get("Candidate Response Claims"))
+        print("Common Claims:\n",result.get("Common Claims"))
+        logging.info("Recall:{}, Precision:{}, f1:{}".format(result.get("LLM Recall"), result.get("LLM Precision"), result.get("LLM F1")))
+        print(json.dumps({column: value for column, value in result.items() if "Claims" not in column}, indent=4))
+        return
+
+    eval = Evaluate(metrics=["llm"], judge_timeout=args.judge_timeout, judge_backend=_make_judge_backend(args))
+    result = eval.evaluate_via_llm(args.question, args.golden_response, args.candidate_response)
+    if result is None:
+        logging.error("The judge failed to evaluate the candidate response.")
+        exit(1)
+    recall, precision, f1, response = result
     _disp_response(response)
     logging.info("Recall:{}, Precision:{}, f1:{}".format(recall, precision,f1))
+
+def serve_evaluations(args):
+    """
+        Serve evaluation requests over HTTP with a warm evaluator.
+
+        Args:
+            args: Contains the address of the server, its queue settings and the evaluator settings
+    """
+    from server import serve
+    serve(_make_evaluator(args), args.host, args.port, args.max_pending, args.max_batch, args.request_timeout)
     
 
+def _metrics(value):
+    metrics = [metric.strip() for metric in value.split(",") if metric.strip()]
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown metrics {sorted(unknown)}, choose from {','.join(METRICS)}")
+    return metrics
+
+def _shard(value):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def _add_evaluator_arguments(parser, cache_dir):
+    # settings of the Evaluate instance shared by the evaluate and serve commands
+    parser.add_argument('--metrics', type=_metrics, default=list(DEFAULT_METRICS), help=f'Comma separated metrics to compute out of {",".join(METRICS)}. grounding needs --context-index. (default: {",".join(DEFAULT_METRICS)})')
+    parser.add_argument('--judge-protocol', dest='judge_protocol', choices=JUDGE_PROTOCOLS, default="single", help='"two-phase" extracts the golden claims once per question and sends only them and the candidate to a shorter matching prompt. (default: single)')
+    parser.add_argument('--judge-pack-size', dest='judge_pack_size', type=int, default=1, help='Number of rows evaluated by a single judge request with the single protocol. Items the judge fails to answer are retried on their own. (default: 1)')
+    _add_judge_backend_arguments(parser)
+    parser.add_argument('--model-precision', dest='model_precision', choices=MODEL_PRECISIONS, default="fp32", help='CPU inference precision of the BERTScore and similarity models. "int8" quantizes their linear layers, "bf16" needs a CPU with AVX512-BF16 or AMX. Check the drift of the scores with the drift command. (default: fp32)')
+    parser.add_argument('--cascade', action='store_true', help='Decide the rows with an obvious verdict (a single number, date or name of the golden response found in or missing from a short candidate, near identical or unrelated responses) without the judge. The deciding tier is saved in the LLM Tier column. The lexical tier needs the rouge and similarity metrics.')
+    parser.add_argument('--cascade-similarity', dest='cascade_similarity', type=_thresholds, default=(0.05, 0.95), help='Similarity scores up to which (with Rouge-1 up to 0.1) and from which (with Rouge-L from 0.9) the cascade decides a mismatch and a match. (default: 0.05,0.95)')
+    parser.add_argument('--judge-retries', dest='judge_retries', type=int, default=5, help='Number of times a judge request is retried with exponential backoff on rate limit (429), server (5xx), timeout and connection errors. (default: 5)')
+    parser.add_argument('--judge-reasks', dest='judge_reasks', type=int, default=2, help='Number of times a prompt is sent again when the judge answers with malformed JSON. Rows still failing get empty LLM columns and are marked failed. (default: 2)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of LLM judge requests in flight at the same time. (default: 8)')
+    parser.add_argument('--rpm', type=int, default=None, help='Requests per minute limit for the LLM judge. (default: no limit)')
+    parser.add_argument('--tpm', type=int, default=None, help='Tokens per minute limit for the LLM judge. (default: no limit)')
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, default=cache_dir, help=f'Directory of the LLM judge response cache. (default: {cache_dir})')
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true', help='Ignore the LLM judge cache and the golden response embedding store.')
+    parser.add_argument('--embedding-store-size', dest='embedding_store_size', type=int, default=2048, help='Maximum size in MB of the golden response embedding store. (default: 2048)')
+    parser.add_argument('--lexical-workers', dest='lexical_workers', type=int, default=None, help='Number of processes computing BLEU and ROUGE. (default: number of cores)')
+    parser.add_argument('--cpu-workers', dest='cpu_workers', type=int, default=1, help='Number of worker processes computing BERTScore and similarity, each loading the models once. (default: 1, computed in the main process)')
+    parser.add_argument('--torch-threads', dest='torch_threads', type=int, default=None, help='Torch threads of every CPU worker. (default: number of cores divided by --cpu-workers)')
+    parser.add_argument('--context-index', dest='context_index', type=str, default=None, help='Directory of the vector index of the source document used by the grounding metric, see the build_index command.')
+    parser.add_argument('--context-top-k', dest='context_top_k', type=int, default=5, help='Number of nearest chunks of the source document retrieved per answer by the grounding metric. (default: 5)')
+
+def _make_evaluator(args):
+    cache_dir = None if args.no_cache else args.cache_dir
+    embedding_store_dir = None if args.no_cache else os.path.join(args.cache_dir, 'embeddings')
+    return Evaluate(concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm, cache_dir=cache_dir,
+                    embedding_store_dir=embedding_store_dir, embedding_store_bytes=args.embedding_store_size * 1024**2,
+                    lexical_workers=args.lexical_workers, metrics=args.metrics, judge_protocol=args.judge_protocol,
+                    judge_pack_size=args.judge_pack_size, judge_timeout=args.judge_timeout, judge_retries=args.judge_retries,
+                    judge_reasks=args.judge_reasks, cpu_workers=args.cpu_workers, torch_threads=args.torch_threads,
+                    context_index_dir=args.context_index, context_top_k=args.context_top_k,
+                    judge_backend=_make_judge_backend(args),
+                    cascade=Cascade(similarity_low=args.cascade_similarity[0], similarity_high=args.cascade_similarity[1]) if args.cascade else None,
+                    model_precision=args.model_precision)
+
+def _thresholds(value):
+    low, high = (float(threshold) for threshold in value.split(","))
+    return low, high
+
+def _add_judge_backend_arguments(parser):
+    parser.add_argument('--judge-backend', dest='judge_backend', choices=JUDGE_BACKENDS, default="chat", help='"chat" sends every prompt to the chat completions endpoint, "completions" sends batches of prompts to the completions endpoint of a local server such as vLLM, which needs --judge-base-url and --judge-model. (default: chat)')
+    parser.add_argument('--judge-base-url', dest='judge_base_url', type=str, default=None, help='Url of an OpenAI compatible server to send the judge prompts to, e.g. http://localhost:8000/v1. No OpenAI key is needed then. (default: the OpenAI API)')
+    parser.add_argument('--judge-model', dest='judge_model', type=str, default=None, help=f'Model of the judge. (default: {OPENAI_MODEL})')
+    parser.add_argument('--judge-batch-size', dest='judge_batch_size', type=int, default=16, help='Number of prompts sent in one request by the completions backend. Prompts sent concurrently are batched, so --concurrency should be a multiple of it. (default: 16)')
+    parser.add_argument('--judge-connect-timeout', dest='judge_connect_timeout', type=float, default=10, help='Seconds to wait for a connection to the judge server. (default: 10)')
+    parser.add_argument('--judge-timeout', dest='judge_timeout', type=float, default=60, help='Seconds to wait for a single judge request. (default: 60)')
+
+def _make_judge_backend(args):
+    # the connection pool matches the requests in flight, a batch takes a single connection
+    return make_backend(args.judge_backend, args.judge_model, args.judge_base_url, connect_timeout=args.judge_connect_timeout,
+                        max_connections=getattr(args, "concurrency", 1), max_batch=args.judge_batch_size)
+
 def main():
 
     benchmark_file = "./data/rag_benchmark_apple_10k_2022_with_context.xlsx"
     response_file = './data/apple10k_dataworkz_qna_response.txt'
     eval_file = './data/apple10k_evaluation_result.csv'
+    collected_file = './data/apple10k_collected_response.csv'
+    cache_dir = './cache'
+    pdf_file = './data/pdf_files/apple_2022_10k.pdf'
+    index_dir = './data/context_index'
 
 
     parser = argparse.ArgumentParser(description="Welcome to Dataworkz Evaluation Framework.")
@@ -91,28 +324,95 @@ def main():
 
     # Subparser for command c1
     parser_eval = subparsers.add_parser('evaluate', help='Run command evaluate')
-    parser_eval.add_argument('--benchmark', type=str, default=benchmark_file, help=f'Benchmark file. (default: {benchmark_file})')
-    parser_eval.add_argument('--dataworkz_response_file', type=str, default=response_file, help=f'Response file generated from Dataworkz QnA. (default: {response_file})')
+    parser_eval.add_argument('--benchmark', type=str, default=benchmark_file, help=f'Benchmark file, an Excel workbook or a csv, JSON lines (.jsonl) or Parquet file. Workbooks are converted once to a Parquet copy in the cache directory. (default: {benchmark_file})')
+    parser_eval.add_argument('--dataworkz_response_file', type=str, nargs='+', default=[response_file], help=f'One or more response files generated from Dataworkz QnA. The responses are grouped by systemId, every system is evaluated against the benchmark. (default: {response_file})')
+    parser_eval.add_argument('--wide_evaluation_file', type=str, default=None, help='When several systems are evaluated, also save the results with one row per question and the metrics of every system side by side.')
     parser_eval.add_argument('--evaluation_file', type=str, default=eval_file, help=f'Evaluation file. (default: {eval_file})')
+    parser_eval.add_argument('--parquet-file', dest='parquet_file', type=str, default=None, help='Also save the results to a Parquet file with typed metric columns, the claims as lists and the run metadata (needs pyarrow). (default: not saved)')
+    parser_eval.add_argument('--collected_response_file', type=str, default=None, help='Optional csv file to save the collated benchmark and generated responses to, for debugging. (default: not saved)')
+    _add_evaluator_arguments(parser_eval, cache_dir)
+    parser_eval.add_argument('--trace-file', dest='trace_file', type=str, default=None, help='JSON lines file to save the per-row and per-stage timing, token usage and retry events to.')
+    parser_eval.add_argument('--prometheus-file', dest='prometheus_file', type=str, default=None, help='File to save the run summary to in the Prometheus text format.')
+    parser_eval.add_argument('--shard', type=_shard, default=None, help='Evaluate only the shard i (0 based) of N of the rows, given as i/N. The rows are partitioned by serial number, run the N shards with different evaluation files and combine them with the merge command. (default: all the rows)')
+    parser_eval.add_argument('--resume', action='store_true', help='Skip the rows already present in the evaluation file and append the remaining ones.')
     parser_eval.set_defaults(func=evaluate_results)
 
+    parser_eval = subparsers.add_parser('merge', help='Merge the evaluation files of the shards of a run')
+    parser_eval.add_argument('--shard_files', type=str, nargs='+', required=True, help='Evaluation files of all the shards, each with its .meta.json file.')
+    parser_eval.add_argument('--evaluation_file', type=str, default=eval_file, help=f'Merged evaluation file. (default: {eval_file})')
+    parser_eval.add_argument('--wide_evaluation_file', type=str, default=None, help='When several systems were evaluated, also save the merged results with one row per question and the metrics of every system side by side.')
+    parser_eval.set_defaults(func=merge_results)
+
+    parser_eval = subparsers.add_parser('report', help='Summarize evaluation results with bootstrap confidence intervals')
+    parser_eval.add_argument('--result_files', type=str, nargs='+', default=[eval_file], help=f'One or more csv or Parquet evaluation files. Results without the System Name column are named after their file. (default: {eval_file})')
+    parser_eval.add_argument('--metrics', type=str, default=None, help='Comma separated metric columns to report. (default: all the metric columns present)')
+    parser_eval.add_argument('--resamples', type=int, default=10000, help='Number of bootstrap resamples. (default: 10000)')
+    parser_eval.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the intervals. (default: 0.95)')
+    parser_eval.add_argument('--seed', type=int, default=0, help='Seed of the resampling. (default: 0)')
+    parser_eval.add_argument('--output', type=str, default=None, help='JSON file to save the report to.')
+    parser_eval.set_defaults(func=report_results)
+
+    parser_eval = subparsers.add_parser('calibrate', help='Compare the verdicts of the evaluation cascade with the ones of the judge')
+    parser_eval.add_argument('--judge_file', type=str, default=eval_file, help=f'csv or Parquet evaluation file of a run without --cascade. (default: {eval_file})')
+    parser_eval.add_argument('--cascade_file', type=str, default=None, help='csv or Parquet evaluation file of the same rows evaluated with --cascade. (default: replay the cascade on the judge file, without any judge call)')
+    parser_eval.add_argument('--cascade-similarity', dest='cascade_similarity', type=_thresholds, default=(0.05, 0.95), help='Similarity thresholds of the replayed cascade. (default: 0.05,0.95)')
+    parser_eval.add_argument('--threshold', type=float, default=0.5, help='LLM F1 from which a verdict counts as a match. (default: 0.5)')
+    parser_eval.add_argument('--output', type=str, default=None, help='JSON file to save the calibration report to.')
+    parser_eval.set_defaults(func=calibrate_cascade)
+
+    parser_eval = subparsers.add_parser('drift', help='Compare the scores and throughput of the int8 or bf16 models with the fp32 ones')
+    parser_eval.add_argument('--response_file', type=str, default=collected_file, help=f'csv file of collated responses to score. (default: {collected_file})')
+    parser_eval.add_argument('--model-precision', dest='model_precision', choices=MODEL_PRECISIONS[1:], default="int8", help='Precision compared with fp32. (default: int8)')
+    parser_eval.add_argument('--metrics', type=_metrics, default=["bertscore", "similarity"], help='Comma separated metrics to compare out of bertscore,similarity. (default: bertscore,similarity)')
+    parser_eval.add_argument('--rows', type=int, default=None, help='Number of rows of the file to score. (default: all)')
+    parser_eval.add_argument('--batch-size', dest='batch_size', type=int, default=64, help='Number of sentences per forward pass. (default: 64)')
+    parser_eval.add_argument('--max-drift', dest='max_drift', type=float, default=0.02, help='Largest absolute difference of a score from the fp32 one, the command fails above it. Not yet measured on the real models. (default: 0.02)')
+    parser_eval.add_argument('--output', type=str, default=None, help='JSON file to save the drift report to.')
+    parser_eval.set_defaults(func=report_drift)
+
+    parser_eval = subparsers.add_parser('build_index', help='Build the vector index of the source document used by the grounding metric')
+    parser_eval.add_argument('--pdf', type=str, default=pdf_file, help=f'Source document of the benchmark. (default: {pdf_file})')
+    parser_eval.add_argument('--index-dir', dest='index_dir', type=str, default=index_dir, help=f'Directory to save the index to. (default: {index_dir})')
+    parser_eval.add_argument('--model', type=str, default="all-MiniLM-L6-v2", help='Sentence transformers model embedding the chunks and the answers. (default: all-MiniLM-L6-v2)')
+    parser_eval.add_argument('--chunk-words', dest='chunk_words', type=int, default=200, help='Number of words per chunk. (default: 200)')
+    parser_eval.add_argument('--chunk-overlap', dest='chunk_overlap', type=int, default=50, help='Number of words shared by consecutive chunks. (default: 50)')
+    parser_eval.set_defaults(func=build_context_index)
+
     parser_eval = subparsers.add_parser('evaluate_question', help='Evaluate a single question')
     parser_eval.add_argument('--question', type=str, required=True, help='Benchmark file.')
     parser_eval.add_argument('--golden_response', type=str, required=True, help='Golden response.')
     parser_eval.add_argument('--candidate_response', type=str, default=eval_file, help='Candidate response for the question.')
+    _add_judge_backend_arguments(parser_eval)
+    parser_eval.add_argument('--server', type=str, default=None, help='Url of an evaluation server started with the serve command, e.g. http://127.0.0.1:8765, to evaluate the question with its warm models and caches instead of in this process. All the metrics of the server are returned.')
     parser_eval.set_defaults(func=evaluate_question)
 
+    parser_eval = subparsers.add_parser('serve', help='Serve evaluation requests over HTTP, keeping the models warm')
+    parser_eval.add_argument('--host', type=str, default="127.0.0.1", help='Address to listen on. (default: 127.0.0.1)')
+    parser_eval.add_argument('--port', type=int, default=8765, help='Port to listen on. (default: 8765)')
+    parser_eval.add_argument('--max-pending', dest='max_pending', type=int, default=64, help='Number of requests allowed to wait, further requests get a 503 response until the queue drains. (default: 64)')
+    parser_eval.add_argument('--max-batch', dest='max_batch', type=int, default=256, help='Maximum number of queued records evaluated together. (default: 256)')
+    parser_eval.add_argument('--request-timeout', dest='request_timeout', type=float, default=600, help='Seconds a request waits for its evaluation before a 504 response. (default: 600)')
+    _add_evaluator_arguments(parser_eval, cache_dir)
+    parser_eval.set_defaults(func=serve_evaluations)
+
     args = parser.parse_args()
 
     if args.command:
+        # only the commands calling the judge need the key
+        uses_judge = (args.command == "evaluate_question" and not args.server) or \
+                     (args.command in ["evaluate", "serve"] and "llm" in args.metrics)
+        # OpenAI compatible local servers do not check the key
+        if uses_judge and not args.judge_base_url and not check_openai_api_key():
+            exit(1)  # Exit the script if the API key is not set
         args.func(args)
     else:
         parser.print_help()
     
 def check_openai_api_key():
-    api_key = read_openai_key()
+    # the key of the config file takes precedence over the environment
+    api_key = read_openai_key() or os.environ.get('OPENAI_API_KEY')
     if api_key is None or api_key == "":
-        print("The OPENAI_API_KEY is not set in the config file. Please set it to continue.")
+        print("The OPENAI_API_KEY is not set in the config file or the environment. Please set it to continue.")
         return False
     else:
         os.environ['OPENAI_API_KEY'] = api_key
@@ -120,6 +420,4 @@ def check_openai_api_key():
         return True
 
 if __name__ == "__main__":
-    if not check_openai_api_key():
-        exit(1)  # Exit the script if the API key is not set
     main()
@@ -0,0 +1,104 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging, time
+
+# Drift of the BERTScore and similarity scores computed with a lower precision model against the reference fp32
+# scores, with the throughput of both, on the same rows.
+
+DRIFT_COLUMNS = {"bertscore": ["Bert Precision", "Bert Recall", "Bert Score F1"], "similarity": ["Similarity Score"]}
+
+def _timed_scores(records, precision, metrics, similarity_model, batch_size):
+    import torch
+    from evaluate import Evaluate
+    evaluator = Evaluate(similarity_model=similarity_model, batch_size=batch_size, metrics=metrics, model_precision=precision)
+    try:
+        evaluator.warm_up()
+        # the first forward passes of a model are slower, they are left out of the timing
+        evaluator.evaluate_records(records.head(batch_size))
+        start = time.perf_counter()
+        scores = evaluator.evaluate_records(records)
+        seconds = time.perf_counter() - start
+    finally:
+        evaluator.close()
+    logging.info(f"Scored {len(records)} rows with the {precision} models in {seconds:.2f}s.")
+    return scores, seconds, torch.get_num_threads()
+
+def drift_report(records, precision="int8", metrics=None, similarity_model="all-MiniLM-L6-v2", batch_size=64, max_drift=0.02):
+    """
+    Compare the scores of the `precision` models with the ones of the fp32 models.
+
+    Args:
+        records: DataFrame with the "SNo.", "Question", "Golden Context", "Golden Response" and "Candidate Response" columns.
+        precision: precision compared with fp32, out of scoring_pool.MODEL_PRECISIONS.
+        metrics: metrics to compare out of "bertscore" and "similarity", None for both.
+        similarity_model: name of the sentence transformers model of the similarity metric.
+        batch_size: number of sentences per forward pass.
+        max_drift: largest absolute difference of a score allowed. The default is not derived from a measurement
+            of the real models, the report is what tells whether a precision is accurate enough.
+
+    Returns:
+        dict with the rows per second per core of both precisions and, for every score column, the mean and
+        maximum absolute differences, the Pearson and Spearman correlations and whether the maximum difference
+        is within max_drift.
+    """
+    metrics = list(metrics or DRIFT_COLUMNS)
+    reference, reference_seconds, threads = _timed_scores(records, "fp32", metrics, similarity_model, batch_size)
+    scores, seconds, _ = _timed_scores(records, precision, metrics, similarity_model, batch_size)
+    columns = []
+    for column in (column for metric in metrics for column in DRIFT_COLUMNS[metric]):
+        difference = (scores[column] - reference[column]).abs()
+        columns.append({
+            "column": column,
+            "mean_abs_diff": float(difference.mean()),
+            "max_abs_diff": float(difference.max()),
+            "pearson": float(scores[column].corr(reference[column])),
+            "spearman": float(scores[column].corr(reference[column], method="spearman")),
+            "within_bound": bool(difference.max() <= max_drift)
+        })
+    rows = len(records)
+    return {
+        "rows": rows,
+        "precision": precision,
+        "torch_threads": threads,
+        "max_drift": max_drift,
+        "rows_per_second_per_core": {"fp32": rows / reference_seconds / threads, precision: rows / seconds / threads},
+        "speedup": reference_seconds / seconds,
+        "columns": columns,
+        "passed": all(column["within_bound"] for column in columns)
+    }
+
+def format_drift(report):
+    """
+    Format a drift report as a human readable table.
+    """
+    throughput = report["rows_per_second_per_core"]
+    lines = [f"{report['rows']} rows, {report['torch_threads']} torch threads: "
+             f"{throughput['fp32']:.1f} rows/s/core with fp32, {throughput[report['precision']]:.1f} with "
+             f"{report['precision']} ({report['speedup']:.2f}x).",
+             f"{'column':<20}{'mean |diff|':>12}{'max |diff|':>12}{'pearson':>10}{'spearman':>10}  within {report['max_drift']}"]
+    for row in report["columns"]:
+        lines.append(f"{row['column']:<20}{row['mean_abs_diff']:>12.5f}{row['max_abs_diff']:>12.5f}{row['pearson']:>10.5f}"
+                     f"{row['spearman']:>10.5f}  {'yes' if row['within_bound'] else 'NO'}")
+    return "\n".join(lines)
@@ -0,0 +1,170 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import itertools, os
+
+# Summaries of evaluation results with paired bootstrap confidence intervals. The questions are resampled
+# with replacement, the same resamples for every system, so that the differences between systems are paired.
+# All the resampled means of all the systems and metrics come out of a single matrix product between the
+# resample counts and the per question sums.
+
+REPORT_METRICS = ["LLM Recall", "LLM Precision", "LLM F1", "Bleu Score", "Rouge-1", "Rouge-L", "Bert Precision",
+                  "Bert Recall", "Bert Score F1", "Similarity Score", "Context Support", "Context Support Min",
+                  "Golden Context Overlap"]
+
+def load_results(result_files, metrics=None):
+    """
+    Read the metric columns of one or more csv or Parquet evaluation files.
+
+    Returns:
+        DataFrame with the "System", "SNo." and metric columns. The system is the "System Name" column when
+        present, followed by the system id when several systems share a name, the name of the file otherwise.
+    """
+    import pandas as pd
+    wanted = set(["SNo.", "System Id", "System Name"] + (metrics or REPORT_METRICS))
+    stems = [os.path.splitext(os.path.basename(result_file))[0] for result_file in result_files]
+    tables = []
+    for result_file, stem in zip(result_files, stems):
+        if result_file.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            import result_store
+            columns = [column for column in pq.read_schema(result_file).names if column in wanted]
+            df = result_store.read_results(result_file, columns=columns)
+        else:
+            df = pd.read_csv(result_file, usecols=lambda column: column in wanted, dtype={"System Id": str, "System Name": str})
+        if "System Name" in df.columns:
+            system = df.pop("System Name").astype(str)
+            system_id = df.pop("System Id").astype(str) if "System Id" in df.columns else system
+            ambiguous = system.map(system_id.groupby(system).nunique()) > 1
+            system = system.where(~ambiguous, system + " (" + system_id + ")")
+        else:
+            # runs of the same name in different directories or formats keep their full file name
+            system = stem if stems.count(stem) == 1 else result_file
+        df.insert(0, "System", system)
+        tables.append(df)
+    return pd.concat(tables, ignore_index=True)
+
+def _resample_counts(rng, units, resamples):
+    import numpy as np
+    # number of times every unit is drawn by every resample, as a (resamples, units) matrix
+    draws = rng.integers(0, units, size=(resamples, units), dtype=np.int32)
+    draws += (units * np.arange(resamples, dtype=np.int32))[:, None]
+    return np.bincount(draws.ravel(), minlength=resamples * units).reshape(resamples, units).astype(np.float64)
+
+def _quantiles(values, quantiles):
+    import numpy as np
+    # the nan aware quantiles are several times slower, they are only needed when some resample has no value
+    if np.isnan(values).any():
+        return np.nanquantile(values, quantiles, axis=0)
+    return np.quantile(values, quantiles, axis=0)
+
+def bootstrap_report(df, metrics=None, resamples=10000, confidence=0.95, max_units=1000, seed=0):
+    """
+    Compute the mean of every metric of every system with its bootstrap confidence interval, and the paired
+    differences between every two systems with their confidence interval and significance.
+
+    Args:
+        df: results as returned by load_results.
+        metrics: metric columns to report, None for all the REPORT_METRICS present.
+        resamples: number of bootstrap resamples.
+        confidence: confidence level of the intervals.
+        max_units: above this number of questions, the questions are randomly grouped in max_units blocks which are
+            resampled instead of single questions, bounding the cost for very large result sets.
+        seed: seed of the resampling, the same seed gives the same intervals.
+
+    Returns:
+        dict with the "summary" rows (system, metric, n, mean, ci_low, ci_high) and the "comparisons" rows
+        (metric, system_a, system_b, difference, ci_low, ci_high, p_value), p_value being the two-sided
+        bootstrap probability of no difference.
+    """
+    import numpy as np
+    metrics = [metric for metric in (metrics or REPORT_METRICS) if metric in df.columns and df[metric].notna().any()]
+    systems = df["System"].unique().tolist()
+    # one row per question, one column per metric and system
+    wide = df.drop_duplicates(["System", "SNo."]).set_index(["SNo.", "System"])[metrics].unstack("System")
+    wide = wide.reindex(columns=[(metric, system) for metric in metrics for system in systems])
+    values = wide.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+
+    rng = np.random.default_rng(seed)
+    questions = len(values)
+    units = min(questions, max_units)
+    unit_of = np.arange(questions) if units == questions else rng.permutation(questions) % units
+    order = np.argsort(unit_of, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(unit_of[order]) != 0])
+    sums = np.add.reduceat(np.where(valid, values, 0.0)[order], starts, axis=0)
+    counts = np.add.reduceat(valid[order].astype(np.float64), starts, axis=0)
+
+    resample_counts = _resample_counts(rng, units, resamples)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums.sum(axis=0) / counts.sum(axis=0)
+        boot = (resample_counts @ sums) / (resample_counts @ counts)
+    alpha = (1 - confidence) / 2
+    low, high = _quantiles(boot, [alpha, 1 - alpha])
+
+    summary = []
+    for k, (metric, system) in enumerate(wide.columns):
+        summary.append({"system": system, "metric": metric, "n": int(valid[:, k].sum()), "mean": float(means[k]),
+                        "ci_low": float(low[k]), "ci_high": float(high[k])})
+
+    pairs = [(m * len(systems) + a, m * len(systems) + b) for m in range(len(metrics))
+             for a, b in itertools.combinations(range(len(systems)), 2)]
+    comparisons = []
+    if pairs:
+        first, second = np.array(pairs).T
+        differences = boot[:, first] - boot[:, second]
+        diff_low, diff_high = _quantiles(differences, [alpha, 1 - alpha])
+        # differences within the rounding error of the matrix product count as ties
+        tolerance = 1e-12
+        p_values = np.minimum(1.0, 2 * np.minimum(np.nanmean(differences <= tolerance, axis=0),
+                                                  np.nanmean(differences >= -tolerance, axis=0)))
+        for i, (a, b) in enumerate(pairs):
+            comparisons.append({"metric": wide.columns[a][0], "system_a": wide.columns[a][1], "system_b": wide.columns[b][1],
+                                "difference": float(means[a] - means[b]), "ci_low": float(diff_low[i]),
+                                "ci_high": float(diff_high[i]), "p_value": float(max(p_values[i], 1 / resamples))})
+    return {"questions": questions, "resampled_units": units, "resamples": resamples, "confidence": confidence,
+            "summary": summary, "comparisons": comparisons}
+
+def format_report(report):
+    """
+    Format a bootstrap report as human readable tables.
+    """
+    level = f"{report['confidence']:.0%} CI"
+    # the text columns are as wide as their longest value, with two spaces before the next column
+    width = lambda key, rows, title: max([len(title)] + [len(str(row[key])) for row in rows]) + 2
+    system, metric = width("system", report["summary"], "system"), width("metric", report["summary"], "metric")
+    lines = [f"{'system':<{system}}{'metric':<{metric}}{'n':>8}{'mean':>10}{level:>20}"]
+    for row in report["summary"]:
+        lines.append(f"{row['system']:<{system}}{row['metric']:<{metric}}{row['n']:>8}{row['mean']:>10.4f}"
+                     f"{'[' + format(row['ci_low'], '.4f') + ', ' + format(row['ci_high'], '.4f') + ']':>20}")
+    if report["comparisons"]:
+        comparisons = report["comparisons"]
+        metric = width("metric", comparisons, "metric")
+        system_a, system_b = width("system_a", comparisons, "system a"), width("system_b", comparisons, "system b")
+        lines.append("")
+        lines.append(f"{'metric':<{metric}}{'system a':<{system_a}}{'system b':<{system_b}}{'a - b':>10}{level:>22}{'p':>9}")
+        for row in comparisons:
+            lines.append(f"{row['metric']:<{metric}}{row['system_a']:<{system_a}}{row['system_b']:<{system_b}}{row['difference']:>10.4f}"
+                         f"{'[' + format(row['ci_low'], '.4f') + ', ' + format(row['ci_high'], '.4f') + ']':>22}{row['p_value']:>9.4f}")
+    return "\n".join(lines)
@@ -0,0 +1,123 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import ast, json, math
+
+# Typed columnar storage of the evaluation results. The csv evaluation file keeps the claims as stringified
+# dicts, the Parquet file stores them as lists of strings and the metrics as numbers, with the settings of
+# the run in the schema metadata, so that many runs can be aggregated reading only the columns needed.
+
+METADATA_KEY = b"rag_evaluation"
+INT_COLUMNS = ["SNo.", "Golden Response Claim Count", "Candidate Response Claim Count", "Common Claim Count"]
+FLOAT_COLUMNS = ["Bleu Score", "Rouge-1", "Rouge-L", "Bert Precision", "Bert Recall", "Bert Score F1", "Similarity Score",
+                 "LLM Recall", "LLM Precision", "LLM F1", "Context Support", "Context Support Min", "Golden Context Overlap"]
+CLAIM_COLUMNS = ["Golden Response Claims", "Candidate Response Claims", "Common Claims"]
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.dataset
+    except ImportError:
+        raise ImportError("Parquet results need pyarrow, install it with: pip install pyarrow")
+    return pyarrow
+
+def _is_null(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def _claims(value):
+    # claims come as dicts from the judge, as their repr once read back from the csv file
+    if _is_null(value):
+        return None
+    if isinstance(value, str):
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return [value]
+    if isinstance(value, dict):
+        value = list(value.values())
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [str(claim) for claim in value]
+
+def _int(value):
+    return None if _is_null(value) else int(value)
+
+def _str(value):
+    return None if _is_null(value) else str(value)
+
+def to_arrow(df, metadata=None):
+    """
+    Convert evaluation results to an Arrow table with typed columns.
+
+    Args:
+        df: evaluation results, as returned by Evaluate.evaluate_records or read from the csv evaluation file.
+        metadata: optional dict describing the run, saved as JSON in the schema metadata.
+    """
+    pa = _pyarrow()
+    arrays, fields = [], []
+    for column in df.columns:
+        values = df[column].tolist()
+        if column in INT_COLUMNS:
+            array = pa.array([_int(value) for value in values], type=pa.int64())
+        elif column in FLOAT_COLUMNS:
+            array = pa.array([None if _is_null(value) else float(value) for value in values], type=pa.float64())
+        elif column in CLAIM_COLUMNS:
+            array = pa.array([_claims(value) for value in values], type=pa.list_(pa.string()))
+        else:
+            array = pa.array([_str(value) for value in values], type=pa.string())
+        arrays.append(array)
+        fields.append(pa.field(column, array.type))
+    schema = pa.schema(fields, metadata={METADATA_KEY: json.dumps(metadata or {})})
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def write_parquet(df, parquet_file, metadata=None):
+    """
+    Save evaluation results to a Parquet file, see to_arrow.
+    """
+    pa = _pyarrow()
+    pa.parquet.write_table(to_arrow(df, metadata), parquet_file, compression="zstd")
+
+def read_results(source, columns=None, filters=None):
+    """
+    Load evaluation results from one or more Parquet files, reading only the requested columns.
+
+    Args:
+        source: Parquet file, directory of Parquet files or list of Parquet files, e.g. of several runs.
+        columns: columns to read, None for all of them.
+        filters: optional pyarrow.dataset expression selecting the rows, e.g. pyarrow.dataset.field("LLM Status") == "ok".
+
+    Returns:
+        DataFrame of the results.
+    """
+    pa = _pyarrow()
+    return pa.dataset.dataset(source, format="parquet").to_table(columns=columns, filter=filters).to_pandas()
+
+def read_metadata(parquet_file):
+    """
+    Return the run metadata saved in a Parquet file, without reading its rows.
+    """
+    pa = _pyarrow()
+    metadata = pa.parquet.read_schema(parquet_file).metadata or {}
+    return json.loads(metadata.get(METADATA_KEY, b"{}"))
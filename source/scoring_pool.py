@@ -0,0 +1,215 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging, os
+
+# The embedding based metrics spend their time in torch forward passes. They run either in the evaluating
+# process or in worker processes, each with its own copy of the models and its own torch thread budget so
+# that the workers do not oversubscribe the cores. Both paths compute the same length bucketed batches,
+# a batch is always encoded as a whole, so their results are identical.
+
+# precisions of the CPU inference of the embedding models: the reference fp32, the linear layers dynamically
+# quantized to int8, or bf16 autocast, which needs a CPU with AVX512-BF16 or AMX to be faster than fp32
+MODEL_PRECISIONS = ["fp32", "int8", "bf16"]
+
+def load_model(name, similarity_model, precision="fp32"):
+    """
+    Load the model of an embedding based metric, "similarity" or "bertscore".
+
+    Args:
+        name: "similarity" or "bertscore".
+        similarity_model: name of the sentence transformers model of the similarity metric.
+        precision: inference precision out of MODEL_PRECISIONS.
+    """
+    if precision not in MODEL_PRECISIONS:
+        raise ValueError(f"Unknown model precision '{precision}', valid precisions are {MODEL_PRECISIONS}.")
+    logging.info(f"Loading {name} model ({precision}).")
+    if name == "similarity":
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(similarity_model)
+        # the pooling and normalization after the transformer stay in fp32
+        if precision == "int8":
+            quantize_int8(model)
+        elif precision == "bf16":
+            autocast_bf16(model[0].auto_model)
+        return model
+    if name == "bertscore":
+        import bert_score
+        scorer = bert_score.BERTScorer(lang="en", rescale_with_baseline=True)
+        if precision == "int8":
+            quantize_int8(scorer._model)
+        elif precision == "bf16":
+            autocast_bf16(scorer._model)
+        return scorer
+    raise ValueError(f"Unknown model '{name}'.")
+
+def quantize_int8(module):
+    """
+    Replace the linear layers of a module, which hold most of the weights and time of a transformer, with
+    int8 dynamically quantized ones.
+    """
+    import torch, warnings
+    with warnings.catch_warnings():
+        # eager mode quantization is deprecated in favour of torchao, it is still the only one without a new dependency
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def autocast_bf16(module):
+    """
+    Run the forward pass of a module in bf16 autocast, returning float32 outputs.
+    """
+    import torch
+    if not torch.ops.mkldnn._is_mkldnn_bf16_supported():
+        logging.warning("This CPU has no native bf16 support, bf16 inference is likely slower than fp32.")
+    forward = module.forward
+    def bf16_forward(*args, **kwargs):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            return _to_float32(forward(*args, **kwargs))
+    module.forward = bf16_forward
+    return module
+
+def _to_float32(output):
+    import torch
+    if isinstance(output, torch.Tensor):
+        return output.float() if output.is_floating_point() else output
+    if isinstance(output, dict):
+        # transformers ModelOutput is a dict whose items are also attributes
+        for key in list(output.keys()):
+            output[key] = _to_float32(output[key])
+        return output
+    if isinstance(output, (tuple, list)):
+        return type(output)(_to_float32(value) for value in output)
+    return output
+
+def length_batches(sentences, batch_size, length=len):
+    """
+    Split the distinct sentences into batches of sentences of similar length, longest first, to minimize padding.
+    """
+    unique = sorted(dict.fromkeys(sentences), key=length, reverse=True)
+    return [unique[start:start + batch_size] for start in range(0, len(unique), batch_size)]
+
+def by_sentence(sentences, batches, batch_results):
+    """
+    Map the per batch results of length_batches back to the order of the sentences.
+    """
+    results = {}
+    for batch, batch_result in zip(batches, batch_results):
+        results.update(zip(batch, batch_result))
+    return [results[sentence] for sentence in sentences]
+
+def word_count(sentence):
+    return len(sentence.split(" "))
+
+def similarity_encode_batch(model, batch):
+    return model.encode(batch, batch_size=len(batch), convert_to_numpy=True)
+
+def similarity_encode(model, sentences, batch_size):
+    """
+    Compute the sentence embeddings of the similarity metric in the evaluating process.
+    """
+    import numpy as np
+    batches = length_batches(sentences, batch_size)
+    return np.stack(by_sentence(sentences, batches, (similarity_encode_batch(model, batch) for batch in batches)))
+
+# models of a worker process, loaded once by its initializer
+_models = {}
+
+def _init_worker(models, similarity_model, threads, precision="fp32"):
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    for name in models:
+        _models[name] = load_model(name, similarity_model, precision)
+
+def _bertscore_encode(batch):
+    import bertscore_features
+    return bertscore_features.encode_batch(_models["bertscore"], batch)
+
+def _bertscore_score(features):
+    import bertscore_features
+    return bertscore_features.score_batch(_models["bertscore"], *features)
+
+def _bertscore_hash():
+    return _models["bertscore"].hash
+
+def _similarity_encode(batch):
+    return similarity_encode_batch(_models["similarity"], batch)
+
+def _similarity_pairwise(embeddings):
+    return _models["similarity"].similarity_pairwise(*embeddings).tolist()
+
+class ScoringPool:
+    """
+    Worker processes computing the BERTScore and similarity metrics batch by batch.
+    """
+
+    def __init__(self, workers, models, similarity_model, threads=None, precision="fp32"):
+        """
+        Args:
+            workers: number of worker processes.
+            models: names of the models every worker loads when it starts, out of "bertscore" and "similarity".
+            similarity_model: name of the sentence transformers model of the similarity metric.
+            threads: torch intra-op threads of every worker, None to share the cores evenly between the workers.
+            precision: inference precision of the models out of MODEL_PRECISIONS.
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        logging.info(f"Starting {workers} scoring workers with {self.threads} torch threads each.")
+        # torch is not fork safe once it has started its thread pools, the workers start from a fresh interpreter
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(list(models), similarity_model, self.threads, precision))
+        self.__bertscore_hash = None
+
+    def bertscore_encode(self, sentences, batch_size):
+        batches = length_batches(sentences, batch_size, word_count)
+        return by_sentence(sentences, batches, self.pool.map(_bertscore_encode, batches))
+
+    def bertscore_score(self, ref_features, cand_features, batch_size):
+        import torch
+        chunks = [(ref_features[start:start + batch_size], cand_features[start:start + batch_size])
+                  for start in range(0, len(ref_features), batch_size)]
+        preds = torch.cat(list(self.pool.map(_bertscore_score, chunks)), dim=0)
+        return preds[:, 0].tolist(), preds[:, 1].tolist(), preds[:, 2].tolist()
+
+    @property
+    def bertscore_hash(self):
+        if self.__bertscore_hash is None:
+            self.__bertscore_hash = self.pool.submit(_bertscore_hash).result()
+        return self.__bertscore_hash
+
+    def similarity_encode(self, sentences, batch_size):
+        import numpy as np
+        batches = length_batches(sentences, batch_size)
+        return np.stack(by_sentence(sentences, batches, self.pool.map(_similarity_encode, batches)))
+
+    def similarity_pairwise(self, embeddings1, embeddings2):
+        return self.pool.submit(_similarity_pairwise, (embeddings1, embeddings2)).result()
+
+    def close(self):
+        self.pool.shutdown()
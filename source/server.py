@@ -0,0 +1,257 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import itertools, json, logging, queue, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A long lived process holding one warm Evaluate instance, so that single questions are evaluated without
+# paying for the imports and the model loading of a new process. Requests wait in a bounded queue, a single
+# thread evaluates all the queued requests together so that the embedding based metrics run in batches.
+
+INPUT_COLUMNS = ["SNo.", "Question", "Golden Context", "Golden Response", "Candidate Response"]
+REQUEST_KEYS = {"question": "Question", "golden_response": "Golden Response", "candidate_response": "Candidate Response",
+                "golden_context": "Golden Context"}
+
+class _Job:
+    def __init__(self, job_id, records, deadline=None):
+        self.id = job_id
+        self.records = records
+        # monotonic time after which nobody waits for the results anymore
+        self.deadline = deadline
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+class EvaluationQueue:
+    """
+    Bounded queue of evaluation requests served by a single thread.
+    """
+
+    def __init__(self, evaluator, max_pending=64, max_batch=256):
+        """
+        Args:
+            evaluator: Evaluate instance, kept warm between the requests.
+            max_pending: number of requests allowed to wait, further requests are rejected until the queue drains.
+            max_batch: number of records evaluated together at most, except for larger single requests.
+        """
+        self.evaluator = evaluator
+        self.max_batch = max_batch
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.job_ids = itertools.count(1)
+        self.thread = threading.Thread(target=self.__run, name="evaluation", daemon=True)
+        self.thread.start()
+
+    def submit(self, records, timeout=None):
+        """
+        Queue records for evaluation.
+
+        Args:
+            records: records to evaluate.
+            timeout: seconds the caller waits for the results, the records are skipped if they are still
+                queued by then. None to always evaluate them.
+
+        Raises:
+            queue.Full: too many requests are waiting.
+        """
+        job = _Job(next(self.job_ids), records, None if timeout is None else time.monotonic() + timeout)
+        self.jobs.put_nowait(job)
+        return job
+
+    def pending(self):
+        return self.jobs.qsize()
+
+    def __run(self):
+        while True:
+            jobs = [job for job in [self.jobs.get()] if self.__live(job)]
+            size = sum(len(job.records) for job in jobs)
+            # evaluate the requests waiting behind the first one in the same batch
+            while size < self.max_batch:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if self.__live(job):
+                    jobs.append(job)
+                    size += len(job.records)
+            if jobs:
+                self.__evaluate(jobs)
+
+    def __live(self, job):
+        # the caller of an expired job already got a 504, evaluating it would only delay the next requests
+        if job.deadline is None or time.monotonic() < job.deadline:
+            return True
+        logging.warning(f"Skipping a request of {len(job.records)} records whose deadline passed while it was queued.")
+        job.error = "The evaluation did not start in time."
+        job.done.set()
+        return False
+
+    def __evaluate(self, jobs):
+        # the serial numbers carry the request id, so that the rows of different requests can be told apart
+        records = [dict(record, **{"SNo.": f"{job.id}-{i + 1}"}) for job in jobs for i, record in enumerate(job.records)]
+        try:
+            results = self.evaluator.evaluate_records(records).to_dict("records")
+        except Exception as e:
+            logging.exception("Evaluation failed.")
+            for job in jobs:
+                job.error = str(e)
+                job.done.set()
+            return
+        finally:
+            # the events of every row and judge call would otherwise grow for the whole life of the server
+            self.evaluator.tracer.reset()
+        start = 0
+        for job in jobs:
+            job.results = [{column: _json_value(value) for column, value in row.items() if column not in INPUT_COLUMNS}
+                           for row in results[start:start + len(job.records)]]
+            start += len(job.records)
+            job.done.set()
+
+def _json_value(value):
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+def parse_request(body):
+    """
+    Parse the body of an evaluation request, a single record or {"records": [...]}.
+
+    Returns:
+        the records and whether the request is a batch.
+    """
+    request = json.loads(body)
+    batch = isinstance(request, dict) and "records" in request
+    items = request["records"] if batch else [request]
+    if not isinstance(items, list) or not items:
+        raise ValueError("records must be a non empty list.")
+    records = []
+    for item in items:
+        missing = [key for key in ["question", "golden_response", "candidate_response"] if not isinstance(item, dict) or key not in item]
+        if missing:
+            raise ValueError(f"Missing {missing} in a record.")
+        records.append({column: item.get(key, "") for key, column in REQUEST_KEYS.items()})
+    return records, batch
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self.__reply(404, {"error": "Not found."})
+        self.__reply(200, {"status": "ok", "pending": self.server.evaluations.pending(),
+                           "metrics": self.server.evaluations.evaluator.metrics})
+
+    def do_POST(self):
+        if self.path != "/evaluate":
+            return self.__reply(404, {"error": "Not found."})
+        try:
+            records, batch = parse_request(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError as e:
+            return self.__reply(400, {"error": str(e)})
+        try:
+            job = self.server.evaluations.submit(records, self.server.request_timeout)
+        except queue.Full:
+            return self.__reply(503, {"error": "Too many pending requests, retry later."}, {"Retry-After": "1"})
+        if not job.done.wait(self.server.request_timeout):
+            return self.__reply(504, {"error": "The evaluation did not complete in time."})
+        if job.error is not None:
+            return self.__reply(500, {"error": job.error})
+        self.__reply(200, {"results": job.results} if batch else job.results[0])
+
+    def __reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+def serve(evaluator, host="127.0.0.1", port=8765, max_pending=64, max_batch=256, request_timeout=600):
+    """
+    Serve evaluation requests over HTTP until interrupted.
+
+    POST /evaluate accepts {"question", "golden_response", "candidate_response", "golden_context"} and returns the
+    metrics of the record, or {"records": [...]} and returns {"results": [...]}. GET /health returns the status.
+    """
+    evaluator.warm_up()
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.evaluations = EvaluationQueue(evaluator, max_pending, max_batch)
+    server.request_timeout = request_timeout
+    logging.info(f"Serving evaluations on http://{host}:{server.server_address[1]}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def request_evaluation(url, records, timeout=600, retries=3, max_retry_wait=30):
+    """
+    Send records to an evaluation server. Requests rejected with a Retry-After header, because the queue of
+    the server is full, are sent again after the requested wait.
+
+    Args:
+        url: base url of the server, e.g. http://127.0.0.1:8765.
+        records: list of dicts with the question, golden_response, candidate_response and optionally golden_context.
+        timeout: seconds to wait for the answer of the server.
+        retries: number of times a rejected request is sent again.
+        max_retry_wait: upper bound in seconds of the wait before sending a request again.
+
+    Returns:
+        list of the metrics of every record.
+
+    Raises:
+        urllib.error.HTTPError: the server answered with an error, see server_error.
+        urllib.error.URLError: the server could not be reached.
+    """
+    import urllib.error, urllib.request
+    body = json.dumps({"records": records}).encode("utf-8")
+    for attempt in range(retries + 1):
+        request = urllib.request.Request(url.rstrip("/") + "/evaluate", data=body,
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read())["results"]
+        except urllib.error.HTTPError as e:
+            # only the rejections telling when to come back, in seconds, are retried
+            retry_after = (e.headers.get("Retry-After") or "").strip()
+            if not retry_after.isdigit() or attempt == retries:
+                raise
+            wait = min(int(retry_after), max_retry_wait)
+            logging.warning(f"The evaluation server is busy, retrying in {wait}s.")
+            time.sleep(wait)
+
+def server_error(error):
+    """
+    Returns the message of the error answer of an evaluation server, or the reason of the HTTP error.
+    """
+    try:
+        return json.loads(error.read())["error"]
+    except (ValueError, KeyError, TypeError):
+        return error.reason
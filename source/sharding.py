@@ -0,0 +1,151 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib, json, logging, os
+
+# The rows are partitioned by serial number, so that the responses of every system to a question are evaluated
+# by the same shard and share the golden response work (tokenization, embeddings, golden claims).
+
+def parse_shard(value):
+    """
+    Parse a shard specification "i/N", i being the 0 based index of the shard out of N shards.
+
+    Returns:
+        tuple (i, N).
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected i/N, e.g. 0/4.")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{value}', the index must be between 0 and {count - 1}.")
+    return index, count
+
+def key_columns(df):
+    # rows are identified by their serial number, and by their system when several systems are evaluated
+    return ["System Id", "SNo."] if "System Id" in df.columns else ["SNo."]
+
+def row_keys(df):
+    return [[str(value) for value in key] for key in df[key_columns(df)].itertuples(index=False, name=None)]
+
+def data_fingerprint(df):
+    """
+    sha256 hex digest of the collated benchmark and responses, before sharding.
+    """
+    return hashlib.sha256(df.to_csv(index=False).encode("utf-8")).hexdigest()
+
+def select_shard(df, index, count):
+    """
+    Select the rows of a shard, deterministically from their serial numbers.
+
+    Returns:
+        the rows of the shard and their positions in df.
+    """
+    selected = [position for position, sno in enumerate(df["SNo."]) if int(sno) % count == index]
+    return df.iloc[selected].reset_index(drop=True), selected
+
+def metadata_file(eval_file):
+    return eval_file + ".meta.json"
+
+def write_shard_metadata(eval_file, index, count, shard_df, positions, total_rows, fingerprints):
+    """
+    Save next to the evaluation file of a shard what the merge needs to check it: the shard, the keys and positions
+    of its rows and the fingerprints of the data, config and prompts.
+    """
+    metadata = {
+        "shard": index,
+        "shards": count,
+        "total_rows": total_rows,
+        "fingerprints": fingerprints,
+        "key_columns": key_columns(shard_df),
+        "keys": row_keys(shard_df),
+        "positions": positions
+    }
+    path = metadata_file(eval_file)
+    with open(path + ".tmp", "w") as f:
+        json.dump(metadata, f)
+    os.replace(path + ".tmp", path)
+
+def merge_shards(eval_files):
+    """
+    Merge the evaluation files of all the shards of a run into one table with the same rows, in the same order,
+    as an unsharded run.
+
+    Raises:
+        ValueError: a shard is missing, or its fingerprints differ, or rows are missing or duplicated.
+    """
+    import pandas as pd
+    shards = {}
+    for eval_file in eval_files:
+        try:
+            with open(metadata_file(eval_file)) as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"{eval_file} has no shard metadata file {metadata_file(eval_file)}.")
+        if metadata["shard"] in shards:
+            raise ValueError(f"Shard {metadata['shard']} is given twice: {shards[metadata['shard']][0]} and {eval_file}.")
+        shards[metadata["shard"]] = (eval_file, metadata)
+
+    first_file, first = next(iter(shards.values()))
+    for eval_file, metadata in shards.values():
+        for name in ["shards", "total_rows", "key_columns"]:
+            if metadata[name] != first[name]:
+                raise ValueError(f"{eval_file} and {first_file} are shards of different runs ({name} differ).")
+        for name, fingerprint in first["fingerprints"].items():
+            if metadata["fingerprints"].get(name) != fingerprint:
+                raise ValueError(f"The {name} fingerprint of {eval_file} differs from {first_file}, they were evaluated "
+                                 f"with different {name}.")
+    missing_shards = sorted(set(range(first["shards"])) - set(shards))
+    if missing_shards:
+        raise ValueError(f"Shards {missing_shards} of {first['shards']} are missing.")
+
+    tables = []
+    for shard in sorted(shards):
+        eval_file, metadata = shards[shard]
+        if not metadata["keys"]:
+            # more shards than serial numbers, nothing was evaluated
+            continue
+        # values are kept as written by the shard, the merged file is the same as the one of an unsharded run
+        df = pd.read_csv(eval_file, dtype=str, keep_default_na=False)
+        keys = [tuple(key) for key in row_keys(df)]
+        expected = dict(zip((tuple(key) for key in metadata["keys"]), metadata["positions"]))
+        duplicated = df.index[pd.Series(keys).duplicated()].tolist()
+        if duplicated:
+            raise ValueError(f"{eval_file} has {len(duplicated)} duplicated rows, e.g. {keys[duplicated[0]]}.")
+        unexpected = [key for key in keys if key not in expected]
+        if unexpected:
+            raise ValueError(f"{eval_file} has {len(unexpected)} rows which do not belong to shard {shard}, e.g. {unexpected[0]}.")
+        present = set(keys)
+        missing = [key for key in expected if key not in present]
+        if missing:
+            raise ValueError(f"{eval_file} is missing {len(missing)} of its {len(expected)} rows, e.g. {missing[0]}. "
+                             f"Complete it with --resume.")
+        df.insert(0, "_position", [expected[key] for key in keys])
+        tables.append(df)
+
+    merged = pd.concat(tables, ignore_index=True)
+    if len(merged) != first["total_rows"]:
+        raise ValueError(f"The shards hold {len(merged)} rows, {first['total_rows']} were expected.")
+    logging.info(f"Merged {len(merged)} rows of {len(shards)} shards.")
+    return merged.sort_values("_position").drop(columns="_position").reset_index(drop=True)
@@ -23,9 +23,11 @@ SOFTWARE.
 """
 
 import csv, logging
-import pandas as pd
-import os, openai
-import json
+import os
+import json, gzip, time
+
+OPENAI_MODEL = "gpt-4-0125-preview"
+OPENAI_TEMPERATURE = 0
 
 def read_openai_key():
     file_path = "./config/config.json"
@@ -48,56 +50,102 @@ def read_openai_key():
         return None
 
 def get_openai_response(prompt):
-    messages = [{"role": "user", "content": prompt}]
-    response = openai.chat.completions.create(
-        model="gpt-4-0125-preview",
-        messages=messages,
-        temperature=0,
-    )
-    logging.debug("\nOpenAI Response:\n", response)
-    return response.choices[0].message.content
+    return get_openai_completion(prompt)[0]
+
+def get_openai_completion(prompt, timeout=None):
+    """
+    Returns the content of the completion and its token usage as a dict with the prompt_tokens and completion_tokens keys.
+
+    Args:
+        prompt: prompt sent to the model.
+        timeout: seconds to wait for the response, None for the default of the client.
+    """
+    global _openai_backend
+    if _openai_backend is None:
+        from judge_backend import OpenAIChatBackend
+        _openai_backend = OpenAIChatBackend()
+    return _openai_backend.complete(prompt, timeout)
+
+_openai_backend = None
+
+
+# tags of the fields of a record in the Dataworkz QnA response dump, mapped to the record keys
+RESPONSE_TAGS = {
+    "question :": "question",
+    "answer :": "answer",
+    "links :": "links",
+    "systemid :": "system_id",
+    "systemname :": "system_name",
+    "queryplan :": "query_plan",
+    "type :": "type",
+    "questionuuid :": "question_uuid",
+    "status :": "status",
+    "probe :": "probe"
+}
+
+def _open_text(file_path):
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, 'rt')
+    return open(file_path, 'r')
+
+def _make_record(fields):
+    record = {key: " ".join(lines).strip() for key, lines in fields.items()}
+    if "links" in record:
+        links = record["links"].strip("[]")
+        record["links"] = [link.strip() for link in links.split(",")] if links else []
+    return record
+
+def iter_responses(file_path, tags=RESPONSE_TAGS):
+    """
+    Parse a Dataworkz QnA response dump one record at a time, using constant memory.
+
+    Args:
+        file_path: response dump, gzip compressed if the name ends with .gz
+        tags: mapping of the (lower case) field tags to the record keys. The "question" field starts a new record.
+
+    Yields:
+        dict with the question, answer, list of links, system id/name, query plan and the remaining fields of a record.
+    """
+    tags = {tag.lower(): key for tag, key in tags.items()}
+    fields = {}
+    key = None
+    count = 0
+    size = 0
+    start = time.perf_counter()
+
+    with _open_text(file_path) as file:
+        for line in file:
+            size += len(line)
+            line = line.strip()
+            lowered = line.lower()
+            tag = next((t for t in tags if lowered.startswith(t)), None)
+            if tag is not None:
+                key = tags[tag]
+                if key == "question" and fields:
+                    count += 1
+                    yield _make_record(fields)
+                    fields = {}
+                fields.setdefault(key, []).append(line[len(tag):].strip())
+            elif key is not None:
+                fields[key].append(line)
 
+    if fields:
+        count += 1
+        yield _make_record(fields)
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Parsed {count} responses ({size / 1024**2:.1f} MB) in {elapsed:.2f}s, "
+                 f"{count / max(elapsed, 1e-9):.0f} responses/s, {size / 1024**2 / max(elapsed, 1e-9):.1f} MB/s.")
 
 def extract_response(file_path,qtag, atag, ntag):
-    qtag = qtag.lower()
-    atag = atag.lower()
-    ntag = ntag.lower()
+    tags = dict(RESPONSE_TAGS)
+    tags.update({qtag: "question", atag: "answer", ntag: "links"})
 
     questions = []
     answers = []
-    
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-        
-        qcapture = False
-        acapture = False
-        qlines = []
-        alines = []
-        
-        for line in lines:
-            line = line.strip()
-            logging.debug("Line:\n",line)
-            
-            if line.lower().startswith(qtag):
-                qlines.append(line[len(qtag):].strip())
-                qcapture = True
-            elif line.lower().startswith(atag):
-                logging.debug("Question added:", " ".join(qlines).strip())
-                questions.append(" ".join(qlines).strip())
-                qlines = []
-                alines.append(line[len(atag):].strip())
-                qcapture = False
-                acapture = True
-            elif line.lower().startswith(ntag):
-                logging.debug("Answer added:"," ".join(alines).strip())
-                answers.append(" ".join(alines).strip())
-                alines = []
-                qcapture = False
-                acapture = False
-            elif qcapture == True:
-                qlines.append(line)
-            elif acapture == True:
-                alines.append(line)
+    for record in iter_responses(file_path, tags):
+        questions.append(record.get("question", ""))
+        answers.append(record.get("answer", ""))
 
     return questions, answers
             
@@ -110,9 +158,74 @@ def write_answers_to_csv(question, golden_ctxt, golden_resp, cand_resp, response
             sno += 1
             writer.writerow([sno,q,gc,gr,cr])  # Write each answer in a new row
 
-def get_golden_response(golden_file):
-    # Read the Excel file
-    df = pd.read_excel(golden_file)
+def collate_responses(question, golden_ctxt, golden_resp, cand_resp):
+    """
+    Collate the benchmark and the generated responses in memory, with the same layout and values as the
+    csv file written by write_answers_to_csv.
+    """
+    import pandas as pd
+    df = pd.DataFrame(list(zip(question, golden_ctxt, golden_resp, cand_resp)),
+                      columns=["Question", "Golden Context", "Golden Response", "Candidate Response"])
+    # the benchmark holds numbers and dates as well, they are evaluated as text like after the csv round-trip
+    for column in df.columns:
+        df[column] = df[column].map(lambda value: value if pd.isna(value) else str(value))
+    df.insert(0, "SNo.", range(1, len(df) + 1))
+    return df
+
+def group_responses_by_system(response_files):
+    """
+    Read the records of one or more response dumps grouped by the RAG system that generated them.
+
+    Returns:
+        dict mapping the system id to a dict with the system "name" and its "questions" and "answers" in
+        the order of the dump. Records without a system id are grouped by file name.
+    """
+    systems = {}
+    for file_path in response_files:
+        for record in iter_responses(file_path):
+            system_id = record.get("system_id") or os.path.basename(file_path)
+            system = systems.setdefault(system_id, {"name": record.get("system_name") or system_id, "questions": [], "answers": []})
+            system["questions"].append(record.get("question", ""))
+            system["answers"].append(record.get("answer", ""))
+    return systems
+
+def collate_systems(systems, golden_ctxt, golden_resp):
+    """
+    Collate the responses of every system with the benchmark in a single long table. The "System Id" and
+    "System Name" columns are only added when there is more than one system.
+    """
+    import pandas as pd
+    tables = []
+    for system_id, system in systems.items():
+        records = collate_responses(system["questions"], golden_ctxt, golden_resp, system["answers"])
+        if len(systems) > 1:
+            records.insert(1, "System Id", system_id)
+            records.insert(2, "System Name", system["name"])
+        tables.append(records)
+    return pd.concat(tables, ignore_index=True)
+
+def to_wide_results(df):
+    """
+    Pivot a long evaluation result with the "System Name" column to one row per question, with the
+    metric columns of every system suffixed by the system name.
+    """
+    base_columns = ["SNo.", "Question", "Golden Context", "Golden Response"]
+    per_system = [column for column in df.columns if column not in base_columns + ["System Id", "System Name"]]
+    wide = df.drop_duplicates("SNo.")[base_columns].set_index("SNo.")
+    for system_name, system_df in df.groupby("System Name", sort=False):
+        wide = wide.join(system_df.set_index("SNo.")[per_system].add_suffix(f" [{system_name}]"))
+    return wide.reset_index()
+
+def get_golden_response(golden_file, cache_dir=None):
+    """
+    Read the golden responses and contexts of a benchmark workbook, csv, JSON lines or Parquet file.
+
+    Args:
+        golden_file: the benchmark file.
+        cache_dir: directory of the columnar copies of the benchmark workbooks, None to parse the workbook every time.
+    """
+    from benchmark_store import load_benchmark
+    df = load_benchmark(golden_file, ['Golden Response', 'Golden Context'], cache_dir)
 
     # Retrieve the data from the specified column
     golden_response = df['Golden Response']
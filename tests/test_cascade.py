@@ -0,0 +1,45 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import pandas as pd
+from cascade import calibration_report, format_calibration
+
+def _results(f1s, tiers=None):
+    # as loaded by report.load_results
+    rows = [{"System": "run", "SNo.": i + 1, "Golden Response": "Net sales were $394.3 billion.",
+             "Candidate Response": "The company discussed many topics in its annual report this year.", "LLM F1": f1}
+            for i, f1 in enumerate(f1s)]
+    df = pd.DataFrame(rows, columns=["System", "SNo.", "Golden Response", "Candidate Response", "LLM F1"]).astype({"LLM F1": float})
+    if tiers is not None:
+        df["LLM Tier"] = tiers
+    return df
+
+def test_format_calibration_without_fast_tier_rows():
+    judge = _results([1.0, 0.5])
+    text = format_calibration(calibration_report(judge, _results([1.0, 0.5], ["judge", "judge"])))
+    assert "0.0% decided without the judge" in text and "n/a" in text
+
+def test_format_calibration_without_rows():
+    text = format_calibration(calibration_report(_results([]), _results([])))
+    assert text.startswith("0 rows") and "mean LLM F1 n/a with the cascade and n/a with the judge." in text
@@ -0,0 +1,60 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import numpy as np
+import embedding_store
+from embedding_store import EmbeddingStore
+
+def test_eviction_keeps_the_running_total(tmp_path):
+    # room for three 1 KiB entries
+    store = EmbeddingStore(str(tmp_path), max_bytes=3 * 1024)
+    for i in range(5):
+        store.put("model", f"text {i}", np.full(256, i, dtype=np.float32))
+    store.put("model", "text 4", np.full(256, 4, dtype=np.float32))
+    assert store.total_bytes == sum(entry["nbytes"] for entry in store.index.values()) == 3 * 1024
+    assert [store.get("model", f"text {i}") is None for i in range(5)] == [True, True, False, False, False]
+    store.save()
+    assert EmbeddingStore(str(tmp_path), max_bytes=3 * 1024).total_bytes == 3 * 1024
+
+def test_crc_is_checked_once_per_entry(tmp_path, monkeypatch):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("model", "text", np.arange(8, dtype=np.float32))
+    store.save()
+    path = tmp_path / EmbeddingStore.make_key("model", "text")[:2] / (EmbeddingStore.make_key("model", "text") + ".npy")
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    # a new process detects the corrupted entry on its first read
+    store = EmbeddingStore(str(tmp_path))
+    assert store.get("model", "text") is None and store.total_bytes == 0
+
+    store.put("model", "text", np.arange(8, dtype=np.float32))
+    store.save()
+    store = EmbeddingStore(str(tmp_path))
+    checks = []
+    crc32 = embedding_store.zlib.crc32
+    monkeypatch.setattr(embedding_store.zlib, "crc32", lambda data: checks.append(1) or crc32(data))
+    for _ in range(3):
+        assert store.get("model", "text").tolist() == list(range(8))
+    assert len(checks) == 1
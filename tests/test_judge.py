@@ -0,0 +1,177 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json, os, threading
+from cache import JudgeCache
+from evaluate import Evaluate
+from judge import EmptyResponseError, JudgeExecutor, parse_json_response
+from judge_backend import JudgeBackend
+
+VALID_RESPONSE = json.dumps({"Golden Response Claims": {"1": "Revenue was $5M."}, "Candidate Response Claims": {"1": "Revenue was $5M."},
+                             "Common Claims": {"1": "Revenue was $5M."}, "No of Golden Response Claims": 1,
+                             "No of Candidate Response Claims": 1, "No of Common Claims": 1})
+
+class _ScriptedBackend(JudgeBackend):
+    # answers every prompt with the next response of the script, the last one is repeated
+    def __init__(self, responses):
+        super().__init__("scripted", 0)
+        self.responses = list(responses)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def complete(self, prompt, timeout=None):
+        with self.lock:
+            response = self.responses[min(self.calls, len(self.responses) - 1)]
+            self.calls += 1
+        return response, {"prompt_tokens": 1, "completion_tokens": 1}
+
+def _record(sno):
+    return {"SNo.": sno, "Question": f"What was the revenue in year {sno}?", "Golden Context": "",
+            "Golden Response": "Revenue was $5M.", "Candidate Response": "Revenue was $5M."}
+
+def test_empty_response_is_not_cached(tmp_path):
+    cache = JudgeCache(str(tmp_path))
+    executor = JudgeExecutor(concurrency=1, cache=cache, backend=_ScriptedBackend([None]))
+    for response in (None, "  "):
+        executor.backend.responses = [response]
+        try:
+            executor.complete("prompt")
+            assert False, "an empty response must raise"
+        except EmptyResponseError:
+            pass
+    assert cache.conn.execute("SELECT COUNT(*) FROM judge_cache").fetchone()[0] == 0
+    cache.close()
+
+def test_none_response_marks_only_the_row_failed(tmp_path):
+    # the first row gets no content on every attempt, the second one gets a valid answer
+    backend = _ScriptedBackend([None, None, None, VALID_RESPONSE])
+    evaluator = Evaluate(metrics=["llm"], concurrency=1, cache_dir=str(tmp_path / "cache"), judge_backend=backend, judge_reasks=2)
+    eval_file = str(tmp_path / "eval.csv")
+    results = evaluator.evaluate_records([_record(1), _record(2)], eval_file)
+    evaluator.close()
+    assert backend.calls == 4
+    assert results["LLM Status"].tolist() == ["failed", "ok"]
+    assert results["LLM F1"].isna().tolist() == [True, False]
+
+def test_resume_evaluates_failed_rows_again(tmp_path):
+    eval_file = str(tmp_path / "eval.csv")
+    records = [_record(1), _record(2), _record(3)]
+    evaluator = Evaluate(metrics=["llm"], concurrency=1, judge_backend=_ScriptedBackend([VALID_RESPONSE, None, None, None, VALID_RESPONSE]))
+    evaluator.evaluate_records(records, eval_file)
+    evaluator.close()
+    with open(eval_file) as f:
+        first_run = f.read().splitlines()
+
+    backend = _ScriptedBackend([VALID_RESPONSE])
+    evaluator = Evaluate(metrics=["llm"], concurrency=1, judge_backend=backend)
+    results = evaluator.evaluate_records(records, eval_file, resume=True)
+    evaluator.close()
+    assert backend.calls == 1
+    assert results["SNo."].tolist() == [2]
+    with open(eval_file) as f:
+        lines = f.read().splitlines()
+    # the rows evaluated before are kept unchanged, the failed one is replaced
+    assert lines[:3] == [first_run[0], first_run[1], first_run[3]]
+    assert len(lines) == 4 and lines[3].startswith("2,")
+    assert "failed" not in "\n".join(lines)
+
+def test_batched_prompts_get_their_own_answers():
+    class EchoBackend(JudgeBackend):
+        max_batch = 4
+
+        def complete_batch(self, prompts, timeout=None):
+            return [f"answer to {prompt}" for prompt in prompts], {"prompt_tokens": 1, "completion_tokens": 1}
+
+    executor = JudgeExecutor(concurrency=4, backend=EchoBackend("echo", 0), batch_wait=0.5)
+    prompts = [f"prompt {i}" for i in range(10)]
+    assert list(executor.map(executor.complete, prompts)) == [f"answer to {prompt}" for prompt in prompts]
+
+def test_unquoted_claims_starting_with_a_number_are_repaired():
+    response = """{
+        "Golden Response Claims": {
+            "1": 2022 net sales were $394.3 billion.,
+            "2": -3% change in Mac sales,
+            "3": true to its guidance, the company raised dividends
+        },
+        "No of Golden Response Claims": 3,
+        "Ratio": 0.5,
+        "Done": true,
+        "Missing": null
+    }"""
+    parsed = parse_json_response(response)
+    assert parsed["Golden Response Claims"] == {"1": "2022 net sales were $394.3 billion.", "2": "-3% change in Mac sales",
+                                                "3": "true to its guidance, the company raised dividends"}
+    assert (parsed["No of Golden Response Claims"], parsed["Ratio"], parsed["Done"], parsed["Missing"]) == (3, 0.5, True, None)
+
+def test_resume_keeps_the_column_order_of_the_file(tmp_path):
+    eval_file = str(tmp_path / "eval.csv")
+    records = [_record(1), _record(2)]
+    evaluator = Evaluate(metrics=["llm"], concurrency=1, judge_backend=_ScriptedBackend([VALID_RESPONSE]))
+    evaluator.evaluate_records(records[:1], eval_file)
+    evaluator.close()
+    # the same columns in another order, e.g. saved by a spreadsheet
+    import pandas as pd
+    previous = pd.read_csv(eval_file)
+    previous[list(reversed(previous.columns))].to_csv(eval_file, index=False)
+
+    evaluator = Evaluate(metrics=["llm"], concurrency=1, judge_backend=_ScriptedBackend([VALID_RESPONSE]))
+    evaluator.evaluate_records(records, eval_file, resume=True)
+    evaluator.close()
+    results = pd.read_csv(eval_file)
+    assert list(results.columns) == list(reversed(previous.columns))
+    assert results["SNo."].tolist() == [1, 2]
+    assert results["Question"].tolist() == [_record(1)["Question"], _record(2)["Question"]]
+    assert results["LLM Status"].tolist() == ["ok", "ok"] and results["LLM F1"].tolist() == [1.0, 1.0]
+
+def test_resume_refuses_other_settings_and_columns(tmp_path):
+    import pandas as pd
+    eval_file = str(tmp_path / "eval.csv")
+    evaluator = Evaluate(metrics=["llm"], concurrency=1, judge_backend=_ScriptedBackend([VALID_RESPONSE]))
+    evaluator.evaluate_records([_record(1)], eval_file)
+    evaluator.close()
+    with open(eval_file) as f:
+        content = f.read()
+
+    def resume(records, **settings):
+        evaluator = Evaluate(concurrency=1, judge_backend=_ScriptedBackend([VALID_RESPONSE]), **settings)
+        try:
+            evaluator.evaluate_records(records, eval_file, resume=True)
+            assert False, "the resume must be refused"
+        except ValueError as e:
+            assert "Cannot resume" in str(e)
+        finally:
+            evaluator.close()
+        with open(eval_file) as f:
+            assert f.read() == content
+
+    # other metrics
+    resume([_record(2)], metrics=["llm"], judge_pack_size=4)
+    # several systems appended to a single system file
+    resume([dict(_record(2), **{"System Id": "a"})], metrics=["llm"])
+    # a file without a run file and other columns, e.g. written by another tool
+    os.remove(eval_file + ".run.json")
+    pd.read_csv(eval_file).drop(columns=["LLM Status"]).to_csv(eval_file, index=False)
+    with open(eval_file) as f:
+        content = f.read()
+    resume([_record(2)], metrics=["llm"])
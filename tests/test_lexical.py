@@ -0,0 +1,70 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import lexical
+from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
+from rouge_score import rouge_scorer
+
+def test_shared_pool_matches_in_process_scores():
+    references = [f"Net sales of segment {i} increased by {i % 7} percent in fiscal {2018 + i % 5}." for i in range(40)]
+    candidates = [f"Segment {i} net sales grew {i % 5} percent." for i in range(40)]
+    expected = lexical.score_all(references, candidates, workers=1)
+    pool = lexical.make_pool(2)
+    try:
+        # the same spawned workers serve several calls
+        for _ in range(2):
+            assert lexical.score_all(references, candidates, chunk_size=8, pool=pool) == expected
+    finally:
+        pool.shutdown()
+
+# golden responses and candidates shaped like the Apple 10-K benchmark, with numbers, punctuation, repeated
+# words, long answers and empty texts
+PAIRS = [
+    ("Apple's total net sales were $394.3 billion in 2022.", "Total net sales for fiscal 2022 were $394.3 billion."),
+    ("iPhone net sales increased 7% or $14.8 billion during 2022 compared to 2021.",
+     "The iPhone segment grew by 7 percent, about $14.8 billion, year over year."),
+    ("The Company repurchased $89.4 billion of its common stock and paid dividends and dividend equivalents of $14.8 billion.",
+     "Apple paid $14.8 billion in dividends; it also repurchased $89.4 billion of common stock during the year."),
+    ("Greater China net sales increased due to higher net sales of iPhone and Services.",
+     "Net sales in Greater China increased, driven by iPhone, Services and the Mac."),
+    ("Research and development expense was $26.3 billion.", "I could not find this information in the document."),
+    ("The gross margin percentage was 43.3%, 41.8% and 38.2% in 2022, 2021 and 2020, respectively.",
+     "Gross margin percentage: 43.3% (2022), 41.8% (2021), 38.2% (2020)."),
+    (" ".join(["The Company's services net sales increased across all lines of business."] * 12),
+     " ".join(["Services net sales increased, led by advertising, cloud and AppleCare."] * 9)),
+    ("Yes.", "Yes."),
+    ("", "Net sales were $394.3 billion."),
+    ("Net sales were $394.3 billion.", ""),
+    ("", ""),
+]
+
+def test_scores_match_nltk_and_rouge_score():
+    scorer = rouge_scorer.RougeScorer(['rouge1', 'rougeL'], use_stemmer=True)
+    smoothing = SmoothingFunction().method1
+    for reference, candidate in PAIRS:
+        rouge = scorer.score(reference, candidate)
+        expected = (sentence_bleu([reference.split()], candidate.split(), smoothing_function=smoothing),
+                    rouge['rouge1'].fmeasure, rouge['rougeL'].fmeasure)
+        assert lexical.score(reference, candidate) == expected, (reference, candidate)
+    assert lexical.score_all(*zip(*PAIRS), workers=1) == [lexical.score(reference, candidate) for reference, candidate in PAIRS]
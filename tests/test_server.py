@@ -0,0 +1,120 @@
+"""
+MIT License
+
+© [2024] [Dataworkz]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json, threading, time, urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from instrumentation import Tracer
+from server import EvaluationQueue, request_evaluation, server_error
+
+class _SlowEvaluator:
+    metrics = ["llm"]
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.batches = []
+        self.row_ids = []
+        self.tracer = Tracer()
+
+    def evaluate_records(self, records):
+        import pandas as pd
+        self.batches.append([record["Question"] for record in records])
+        self.row_ids.extend(record["SNo."] for record in records)
+        for record in records:
+            self.tracer.record("judge", 0.0, row=record["SNo."])
+        time.sleep(self.seconds)
+        return pd.DataFrame([dict(record, **{"LLM F1": 1.0}) for record in records])
+
+def _record(question):
+    return {"Question": question, "Golden Context": "", "Golden Response": "a", "Candidate Response": "a"}
+
+def test_queue_skips_expired_jobs():
+    evaluator = _SlowEvaluator(0.3)
+    evaluations = EvaluationQueue(evaluator)
+    first = evaluations.submit([_record("first")], timeout=5)
+    time.sleep(0.1)
+    # queued behind the first request, its caller gives up before the evaluator is free
+    expired = evaluations.submit([_record("expired")], timeout=0.05)
+    assert first.done.wait(5) and expired.done.wait(5)
+    assert first.results == [{"LLM F1": 1.0}]
+    assert expired.results is None and expired.error is not None
+    assert evaluator.batches == [["first"]]
+
+def test_queue_keeps_no_events_and_numbers_rows_per_request():
+    evaluator = _SlowEvaluator(0.0)
+    evaluations = EvaluationQueue(evaluator)
+    for _ in range(3):
+        job = evaluations.submit([_record("a"), _record("b")])
+        assert job.done.wait(5) and len(job.results) == 2
+    assert len(set(evaluator.row_ids)) == 6
+    assert evaluator.tracer.events == []
+
+def _serve(answers):
+    # answers every request with the next (status, headers, payload) of the list
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            status, headers, payload = answers.pop(0)
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def test_request_evaluation_honours_retry_after():
+    busy = (503, {"Retry-After": "0"}, {"error": "Too many pending requests, retry later."})
+    server, url = _serve([busy, busy, (200, {}, {"results": [{"LLM F1": 1.0}]})])
+    try:
+        assert request_evaluation(url, [{"question": "q", "golden_response": "a", "candidate_response": "a"}]) == [{"LLM F1": 1.0}]
+    finally:
+        server.shutdown()
+
+def test_request_evaluation_retries_are_bounded():
+    busy = (503, {"Retry-After": "0"}, {"error": "Too many pending requests, retry later."})
+    server, url = _serve([busy] * 3 + [(200, {}, {"results": []})])
+    try:
+        request_evaluation(url, [], retries=2)
+        assert False, "the request must fail after its retries"
+    except urllib.error.HTTPError as e:
+        assert e.code == 503 and server_error(e) == "Too many pending requests, retry later."
+    finally:
+        server.shutdown()
+
+def test_request_evaluation_unreachable_server():
+    server, url = _serve([])
+    server.shutdown()
+    server.server_close()
+    try:
+        request_evaluation(url, [], timeout=1)
+        assert False, "the request must fail"
+    except urllib.error.URLError:
+        pass